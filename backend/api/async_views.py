@@ -0,0 +1,124 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import path
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import (cached_catalogue, cached_shared_content,
+                       catalogue_etag, catalogue_key, shared_recipes_key)
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from recipes.models import Ingredient, Tag
+
+LIST_ACTIONS = {"get": "list", "post": "create"}
+DETAIL_ACTIONS = {
+    "get": "retrieve",
+    "put": "update",
+    "patch": "partial_update",
+    "delete": "destroy",
+}
+
+
+def is_cacheable(request):
+    """Анонимный GET-запрос, ответ на который отдаётся в JSON"""
+    return (
+        request.method == "GET"
+        and "HTTP_AUTHORIZATION" not in request.META
+        and request.GET.get("format", "json") == "json"
+        and "text/html" not in request.META.get("HTTP_ACCEPT", "")
+    )
+
+
+def recipes_response(request, *args, **kwargs):
+    """Готовый JSON списка или страницы рецепта из общего кэша"""
+    content = cached_shared_content(shared_recipes_key(request))
+    if content is None:
+        return None
+    return HttpResponse(content, content_type="application/json")
+
+
+def catalogue_response(request, model, pk=None):
+    """Справочник или его элемент из кэша с проверкой ETag"""
+    if model is Ingredient and request.GET.get("name"):
+        return None
+    etag = quote_etag(catalogue_etag(model)(request))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = cached_catalogue(catalogue_key(model))
+        if data is not None and pk is not None:
+            data = next((item for item in data if item["id"] == pk), None)
+        if data is None:
+            return None
+        response = HttpResponse(
+            JSONRenderer().render(data), content_type="application/json")
+    response["ETag"] = etag
+    return response
+
+
+def async_read_view(viewset, actions, lookup, **initkwargs):
+    """Асинхронное представление с быстрым путём для анонимного чтения
+
+    lookup собирает ответ из кэша без обращения к БД и выполняется в общем
+    пуле потоков. Если он вернул None, запрос обрабатывает обычное
+    представление DRF в потоке запроса (thread_sensitive), где живут его
+    соединения с БД.
+    """
+    fallback = sync_to_async(viewset.as_view(actions, **initkwargs))
+    lookup = sync_to_async(lookup, thread_sensitive=False)
+
+    async def view(request, *args, **kwargs):
+        if is_cacheable(request):
+            response = await lookup(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await fallback(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+# Маршруты подключаются перед маршрутами роутера в режиме ASGI
+urlpatterns = [
+    path(
+        "recipes/",
+        async_read_view(RecipeViewSet, LIST_ACTIONS, recipes_response,
+                        basename="recipes", detail=False),
+        name="recipes-list",
+    ),
+    path(
+        "recipes/<int:pk>/",
+        async_read_view(RecipeViewSet, DETAIL_ACTIONS, recipes_response,
+                        basename="recipes", detail=True),
+        name="recipes-detail",
+    ),
+    path(
+        "tags/",
+        async_read_view(TagViewSet, LIST_ACTIONS,
+                        partial(catalogue_response, model=Tag),
+                        basename="tags", detail=False),
+        name="tags-list",
+    ),
+    path(
+        "tags/<int:pk>/",
+        async_read_view(TagViewSet, DETAIL_ACTIONS,
+                        partial(catalogue_response, model=Tag),
+                        basename="tags", detail=True),
+        name="tags-detail",
+    ),
+    path(
+        "ingredients/",
+        async_read_view(IngredientViewSet, LIST_ACTIONS,
+                        partial(catalogue_response, model=Ingredient),
+                        basename="ingredients", detail=False),
+        name="ingredients-list",
+    ),
+    path(
+        "ingredients/<int:pk>/",
+        async_read_view(IngredientViewSet, DETAIL_ACTIONS,
+                        partial(catalogue_response, model=Ingredient),
+                        basename="ingredients", detail=True),
+        name="ingredients-detail",
+    ),
+]
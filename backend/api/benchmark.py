@@ -0,0 +1,415 @@
+import csv
+import random
+import re
+import statistics
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from api.exporters import shopping_cart_ingredients
+from api.filters import IngredientFilter
+from recipes.cache import RECIPES_VERSION, bump_version
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TagInRecipe,
+)
+from users.models import Subscribes, User
+
+INGREDIENTS_CSV = Path(settings.BASE_DIR).parent / "data" / "ingredients.csv"
+SAVEPOINT_SQL = re.compile(r"^(RELEASE |ROLLBACK TO )?SAVEPOINT ", re.I)
+BENCHMARK_PREFIX = "benchmark_"
+BENCHMARK_PASSWORD = "benchmark-password"
+TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+)
+
+# max_queries — запросы к БД при повторах с прогретым кэшем,
+# max_cold_queries — первый запрос после сброса кэша (по умолчанию
+# столько же): так проверяется и сериализация мимо кэша.
+Budget = namedtuple(
+    "Budget", ("name", "method", "path", "max_queries", "max_ms", "data",
+               "anonymous", "max_cold_queries"),
+    defaults=(None, False, None),
+)
+
+# Бюджеты запросов к БД и времени ответа для каждого маршрута api/urls.py,
+# кроме служебного /api/profiling/ (только для администраторов).
+# Порядок важен: операции записи идут парами (добавить/удалить), чтобы
+# набор данных оставался неизменным между повторами; удаление рецепта
+# идёт после всех маршрутов рецептов.
+BUDGETS = (
+    Budget("tags-list", "get", "/api/tags/", 0, 50, max_cold_queries=1),
+    Budget("tags-detail", "get", "/api/tags/{tag}/", 1, 50),
+    Budget("ingredients-catalogue", "get", "/api/ingredients/", 0, 150,
+           max_cold_queries=1),
+    Budget("ingredients-list", "get", "/api/ingredients/?name=мор", 1, 150),
+    Budget("ingredients-detail", "get", "/api/ingredients/{ingredient}/",
+           1, 50),
+    Budget("recipes-list", "get", "/api/recipes/", 3, 200,
+           max_cold_queries=7),
+    Budget("recipes-list-anonymous", "get", "/api/recipes/", 0, 200,
+           anonymous=True, max_cold_queries=4),
+    Budget("recipes-detail-anonymous", "get", "/api/recipes/{recipe}/", 0,
+           100, anonymous=True, max_cold_queries=3),
+    Budget("recipes-list-filtered", "get",
+           "/api/recipes/?tags=breakfast&tags=lunch&is_favorited=1", 4, 200,
+           max_cold_queries=5),
+    Budget("recipes-list-cursor", "get", "/api/recipes/?cursor=", 3, 200,
+           max_cold_queries=6),
+    Budget("recipes-list-popular", "get", "/api/recipes/?ordering=-popularity",
+           3, 200, max_cold_queries=7),
+    Budget("recipes-list-author", "get", "/api/recipes/?author={author}",
+           3, 200, max_cold_queries=8),
+    Budget("recipes-search", "get", "/api/recipes/?search=рецепт", 3, 200,
+           max_cold_queries=7),
+    Budget("recipes-cookable", "get",
+           "/api/recipes/cookable/?{pantry}&max_missing=3", 4, 300),
+    Budget("recipes-detail", "get", "/api/recipes/{recipe}/", 3, 100,
+           max_cold_queries=6),
+    Budget("recipes-create", "post", "/api/recipes/", 11, 300,
+           data="recipe", max_cold_queries=12),
+    Budget("recipes-update", "put", "/api/recipes/{own_recipe}/", 20,
+           300, data="recipe"),
+    Budget("recipes-partial-update", "patch", "/api/recipes/{own_recipe}/",
+           20, 300, data="recipe_patch"),
+    Budget("recipes-favorite-add", "post", "/api/recipes/{free_recipe}/"
+           "favorite/", 3, 100),
+    Budget("recipes-favorite-delete", "delete", "/api/recipes/"
+           "{free_recipe}/favorite/", 2, 100),
+    Budget("recipes-shopping-cart-add", "post", "/api/recipes/"
+           "{free_recipe}/shopping_cart/", 4, 100),
+    Budget("recipes-shopping-cart-delete", "delete", "/api/recipes/"
+           "{free_recipe}/shopping_cart/", 4, 100),
+    Budget("recipes-favorite-bulk-add", "post", "/api/recipes/favorite/", 3,
+           200, data="bulk"),
+    Budget("recipes-favorite-bulk-delete", "delete", "/api/recipes/favorite/",
+           3, 200, data="bulk"),
+    Budget("recipes-shopping-cart-bulk-add", "post",
+           "/api/recipes/shopping_cart/", 4, 200, data="bulk"),
+    Budget("recipes-shopping-cart-bulk-delete", "delete",
+           "/api/recipes/shopping_cart/", 5, 200, data="bulk"),
+    Budget("recipes-favorite-bulk-delete-missing", "delete",
+           "/api/recipes/favorite/", 1, 100, data="bulk_missing"),
+    Budget("recipes-shopping-cart-bulk-delete-missing", "delete",
+           "/api/recipes/shopping_cart/", 1, 100, data="bulk_missing"),
+    Budget("recipes-shopping-list", "get", "/api/recipes/shopping_list/", 1,
+           100),
+    Budget("recipes-download-shopping-cart", "get",
+           "/api/recipes/download_shopping_cart/", 3, 200),
+    Budget("recipes-download-shopping-cart-pdf", "get",
+           "/api/recipes/download_shopping_cart/?format=pdf", 3, 200),
+    Budget("recipes-delete", "delete", "/api/recipes/{own_recipe}/", 11, 300),
+    Budget("users-list", "get", "/api/users/", 5, 200),
+    Budget("users-detail", "get", "/api/users/{author}/", 4, 100),
+    Budget("users-me", "get", "/api/users/me/", 1, 100),
+    Budget("users-create", "post", "/api/users/", 2, 2000, data="signup",
+           anonymous=True),
+    Budget("users-subscriptions", "get",
+           "/api/users/subscriptions/?recipes_limit=3", 3, 300),
+    Budget("users-subscriptions-cursor", "get",
+           "/api/users/subscriptions/?cursor=&recipes_limit=3", 2, 300),
+    Budget("users-subscribe", "post", "/api/users/{free_author}/subscribe/",
+           5, 100),
+    Budget("users-unsubscribe", "delete", "/api/users/{free_author}/"
+           "subscribe/", 1, 100),
+    Budget("users-set-password", "post", "/api/users/set_password/", 1,
+           2000, data="set_password"),
+    Budget("auth-token-login", "post", "/api/auth/token/login/", 6, 2000,
+           data="login", anonymous=True),
+    Budget("auth-token-logout", "post", "/api/auth/token/logout/", 1, 100),
+)
+
+
+def read_ingredients(path=INGREDIENTS_CSV):
+    """Чтение каталога ингредиентов или генерация синтетического"""
+    path = Path(path)
+    if not path.exists():
+        return [(f"ингредиент {number}", "г") for number in range(2000)]
+    with path.open(encoding="utf-8") as file:
+        return [tuple(row[:2]) for row in csv.reader(file) if len(row) >= 2]
+
+
+def seed_dataset(users=2000, recipes=3000, seed=0,
+                 ingredients_path=INGREDIENTS_CSV):
+    """Наполнение БД синтетическими данными для замеров"""
+    rng = random.Random(seed)
+    for name, color, slug in TAGS:
+        Tag.objects.get_or_create(
+            slug=slug, defaults={"name": name, "color": color})
+    Ingredient.objects.bulk_create(
+        [
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in read_ingredients(ingredients_path)
+        ],
+        ignore_conflicts=True,
+    )
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        [
+            User(
+                username=f"{BENCHMARK_PREFIX}{number}",
+                email=f"{BENCHMARK_PREFIX}{number}@example.com",
+                first_name="Имя",
+                last_name="Фамилия",
+                password=password,
+            )
+            for number in range(users)
+        ],
+        batch_size=1000,
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith=BENCHMARK_PREFIX)
+        .order_by("id").values_list("id", flat=True)
+    )
+    authors = user_ids[: max(1, len(user_ids) // 5)]
+    Recipe.objects.bulk_create(
+        [
+            Recipe(
+                author_id=rng.choice(authors),
+                name=f"{BENCHMARK_PREFIX}рецепт {number}",
+                image="recipes/benchmark.png",
+                text="Описание рецепта " * 10,
+                cooking_time=rng.randint(5, 120),
+            )
+            for number in range(recipes)
+        ],
+        batch_size=1000,
+    )
+    recipe_ids = list(
+        Recipe.objects.filter(name__startswith=BENCHMARK_PREFIX)
+        .order_by("id").values_list("id", flat=True)
+    )
+    tag_ids = list(Tag.objects.values_list("id", flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+    TagInRecipe.objects.bulk_create(
+        [
+            TagInRecipe(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        ],
+        batch_size=5000,
+    )
+    IngredientInRecipe.objects.bulk_create(
+        [
+            IngredientInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, rng.randint(3, 15))
+        ],
+        batch_size=5000,
+    )
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_documents()
+    viewer, free_author = user_ids[-1], authors[-1]
+    followed = [author for author in authors if author != free_author]
+    free_recipe, own_recipe = recipe_ids[-1], recipe_ids[-2]
+    pool = recipe_ids[:-1]
+    # Рецепт зрителя для изменения и удаления; он есть в чужом избранном
+    # и корзинах, поэтому удаление пересобирает их списки покупок
+    Recipe.objects.filter(pk=own_recipe).update(author_id=viewer)
+    Favorite.objects.bulk_create(
+        [
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(pool, min(len(pool), 5))
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    ShoppingCart.objects.bulk_create(
+        [
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(pool, min(len(pool), 3))
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    Subscribes.objects.bulk_create(
+        [
+            Subscribes(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(followed, min(len(followed), 10))
+            if author_id != user_id
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    Recipe.objects.reconcile_counters()
+    ShoppingListItem.objects.rebuild()
+    return {
+        "viewer": viewer,
+        "author": authors[0],
+        "free_author": free_author,
+        "recipe": recipe_ids[0],
+        "free_recipe": free_recipe,
+        "own_recipe": own_recipe,
+        "tag": tag_ids[0],
+        "ingredient": ingredient_ids[0],
+        "ingredient_ids": ingredient_ids[:10],
+        "tag_ids": tag_ids[:2],
+        "bulk_recipes": list(
+            Recipe.objects.filter(pk__in=recipe_ids)
+            .exclude(favorite_recipe__user_id=viewer)
+            .exclude(shopping_cart__user_id=viewer)
+            .exclude(pk=own_recipe)
+            .values_list("id", flat=True)[:10]
+        ),
+        "missing_recipe": (
+            Recipe.objects.order_by("-id").values_list("id", flat=True)[0]
+            + 1_000_000
+        ),
+        "pantry": "&".join(
+            f"ingredients={ingredient_id}"
+            for ingredient_id in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids[:5]
+            ).values_list("ingredient_id", flat=True)
+        ),
+    }
+
+
+def request_data(budget, context):
+    """Тело запроса для маршрутов, принимающих данные"""
+    if budget.data == "recipe":
+        return {
+            "ingredients": [
+                {"id": ingredient_id, "amount": 10}
+                for ingredient_id in context["ingredient_ids"]
+            ],
+            "tags": context["tag_ids"],
+            "image": (
+                "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAQMA"
+                "AAAl21bKAAAAA1BMVEUAAACnej3aAAAAAXRSTlMAQObYZgAAAApJREFUCNdj"
+                "YAAAAAIAAeIhvDMAAAAASUVORK5CYII="
+            ),
+            "name": f"{BENCHMARK_PREFIX}новый рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+        }
+    if budget.data == "recipe_patch":
+        return {
+            "ingredients": [
+                {"id": ingredient_id, "amount": 20}
+                for ingredient_id in context["ingredient_ids"][5:]
+                + context["ingredient_ids"][:2]
+            ],
+            "tags": context["tag_ids"][:1],
+        }
+    if budget.data == "bulk":
+        return {"recipes": context["bulk_recipes"]}
+    if budget.data == "bulk_missing":
+        return {"recipes": [context["missing_recipe"]]}
+    if budget.data == "signup":
+        return {
+            "email": f"{BENCHMARK_PREFIX}new@example.com",
+            "username": f"{BENCHMARK_PREFIX}new",
+            "first_name": "Имя",
+            "last_name": "Фамилия",
+            "password": BENCHMARK_PASSWORD,
+        }
+    if budget.data == "set_password":
+        return {
+            "current_password": BENCHMARK_PASSWORD,
+            "new_password": BENCHMARK_PASSWORD,
+        }
+    if budget.data == "login":
+        return {
+            "email": f"{BENCHMARK_PREFIX}0@example.com",
+            "password": BENCHMARK_PASSWORD,
+        }
+    return None
+
+
+def invalidate_caches():
+    """Сброс кэшей справочников и рецептов сменой версий, без очистки
+    общего кэша"""
+    for model in (Ingredient, Tag):
+        bump_version(model._meta.model_name)
+    bump_version(RECIPES_VERSION)
+
+
+def measure(client, budget, context, repeat=1):
+    """Запросы к БД первого запроса после сброса кэша, наибольшее число
+    запросов среди повторов (None без повторов) и медианное время ответа
+    маршрута"""
+    path = budget.path.format(**context)
+    data = request_data(budget, context)
+    send = getattr(client, budget.method)
+    invalidate_caches()
+    counts = []
+    timings = []
+    for _ in range(repeat if budget.method == "get" else 1):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = send(path, data, format="json")
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise AssertionError(
+                f"{budget.method.upper()} {path} вернул "
+                f"{response.status_code}: {response.content[:200]!r}"
+            )
+        # Точки сохранения появляются только из-за внешней транзакции,
+        # в которой идёт проверка, и в бюджет не входят.
+        counts.append(sum(
+            not SAVEPOINT_SQL.match(query["sql"])
+            for query in queries.captured_queries
+        ))
+    cold, *warm = counts
+    return cold, max(warm, default=None), statistics.median(timings)
+
+
+def main_queries(user):
+    """Основные запросы маршрутов API от имени user для проверки планов"""
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    recipes = Recipe.objects.with_user_flags(user)
+    page = list(Recipe.objects.values_list("id", flat=True)[:page_size])
+    return {
+        "recipes-list": recipes[:page_size],
+        "recipes-list-author": recipes.filter(author=user)[:page_size],
+        "recipes-list-popular": (
+            recipes.order_by("-favorites_count")[:page_size]),
+        "recipes-list-favorited": (
+            recipes.filter(favorite_recipe__user=user)[:page_size]),
+        "recipes-list-shopping-cart": (
+            recipes.filter(shopping_cart__user=user)[:page_size]),
+        "recipes-search": Recipe.objects.search("рецепт")[:page_size],
+        "recipes-cookable": recipes.cookable(
+            ingredient_ids=list(Ingredient.objects.values_list(
+                "id", flat=True)[:30]),
+            max_missing=3,
+        )[:page_size],
+        "recipes-ingredients": IngredientInRecipe.objects.filter(
+            recipe__in=page).select_related("ingredient"),
+        "recipes-tags": TagInRecipe.objects.filter(
+            recipe__in=page).select_related("tag"),
+        "user-favorites": Favorite.objects.filter(
+            user=user, recipe__in=page).values_list("recipe_id"),
+        "user-shopping-cart": ShoppingCart.objects.filter(
+            user=user, recipe__in=page).values_list("recipe_id"),
+        "user-subscriptions": Subscribes.objects.filter(
+            user=user).values_list("author_id"),
+        "shopping-cart-ingredients": shopping_cart_ingredients(user),
+        "subscriptions": User.objects.filter(subscribed__user=user).annotate(
+            recipes_count=Count("recipes", distinct=True))[:page_size],
+        "ingredients-search": IngredientFilter().filter_name(
+            Ingredient.objects.all(), "name", "мор"),
+    }
@@ -0,0 +1,149 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from foodgram_backend.metrics import observe_cache
+from recipes.cache import (RECIPES_VERSION, get_version, get_versions,
+                           recipe_version_name)
+from recipes.models import Favorite, Ingredient, ShoppingCart, Tag
+from users.models import Subscribes
+
+
+def catalogue_key(model):
+    name = model._meta.model_name
+    return f"catalogue:{name}:{get_version(name)}"
+
+
+def cached_catalogue(key):
+    """Справочник из кэша или None, без обращения к БД"""
+    data = cache.get(key)
+    observe_cache("catalogue", data is not None)
+    return data
+
+
+def catalogue(serializer_class):
+    """Сериализованный справочник целиком из кэша
+
+    Ключ содержит версию справочника, которая увеличивается сигналами
+    post_save/post_delete, поэтому после изменения данные строятся заново.
+    """
+    model = serializer_class.Meta.model
+    key = catalogue_key(model)
+    data = cached_catalogue(key)
+    if data is None:
+        data = [
+            dict(item)
+            for item in serializer_class(model.objects.all(), many=True).data
+        ]
+        cache.set(key, data, settings.CATALOGUE_CACHE_TIMEOUT)
+    return data
+
+
+def catalogue_etag(model):
+    """Функция ETag для представлений справочника model"""
+    name = model._meta.model_name
+
+    def etag(request, *args, **kwargs):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f"{name}-{get_version(name)}-{path}"
+
+    return etag
+
+
+def overlay_user_flags(data, user):
+    """Признаки избранного, корзины и подписки пользователя поверх общего
+    представления рецептов
+
+    Идентификаторы выбираются тремя запросами по рецептам и авторам,
+    попавшим в ответ.
+    """
+    recipes = data["results"] if "results" in data else [data]
+    recipe_ids = [recipe["id"] for recipe in recipes]
+    author_ids = {recipe["author"]["id"] for recipe in recipes}
+    if not recipe_ids:
+        return data
+    favorites = set(
+        Favorite.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .values_list("recipe_id", flat=True)
+    )
+    shopping_cart = set(
+        ShoppingCart.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .values_list("recipe_id", flat=True)
+    )
+    subscriptions = set(
+        Subscribes.objects.filter(user=user, author_id__in=author_ids)
+        .values_list("author_id", flat=True)
+    )
+    for recipe in recipes:
+        recipe["is_favorited"] = recipe["id"] in favorites
+        recipe["is_in_shopping_cart"] = recipe["id"] in shopping_cart
+        recipe["author"]["is_subscribed"] = (
+            recipe["author"]["id"] in subscriptions)
+    return data
+
+
+def shared_recipes_key(request):
+    path = f"{request.get_host()}{request.get_full_path()}"
+    return "recipes:shared:" + ":".join(
+        [
+            str(get_version(RECIPES_VERSION)),
+            str(get_version(Tag._meta.model_name)),
+            str(get_version(Ingredient._meta.model_name)),
+            hashlib.md5(path.encode()).hexdigest(),
+        ]
+    )
+
+
+def cached_shared_content(key):
+    """JSON общего представления рецептов из кэша или None
+
+    Запись действительна, пока не изменились версии попавших в неё
+    рецептов. К БД функция не обращается.
+    """
+    entry = cache.get(key)
+    hit = entry is not None and get_versions(entry["versions"]) == (
+        entry["versions"])
+    observe_cache("recipes", hit)
+    return entry["content"] if hit else None
+
+
+def shared_recipes_response(request, build):
+    """JSON списка или страницы рецепта из общего для всех кэша
+
+    build строит представление без признаков пользователя, поэтому оно
+    одинаково для всех и кэшируется целиком. Ключ содержит версию
+    списков рецептов, версии справочников и адрес запроса, а запись —
+    версии попавших в ответ рецептов, которые сверяются при чтении.
+    Анонимному пользователю отдаётся готовый JSON, для остальных поверх
+    него выставляются их собственные признаки.
+    """
+    key = shared_recipes_key(request)
+    content = cached_shared_content(key)
+    if content is not None:
+        if request.user.is_anonymous:
+            return HttpResponse(content, content_type="application/json")
+        return Response(
+            overlay_user_flags(json.loads(content), request.user))
+    response = build()
+    if response.status_code != 200:
+        return response
+    data = response.data
+    recipes = data["results"] if "results" in data else [data]
+    versions = {
+        name: get_version(name)
+        for name in (recipe_version_name(recipe["id"])
+                     for recipe in recipes)
+    }
+    cache.set(
+        key,
+        {"versions": versions, "content": JSONRenderer().render(data)},
+        settings.RECIPE_CACHE_TIMEOUT,
+    )
+    if not request.user.is_anonymous:
+        overlay_user_flags(data, request.user)
+    return response
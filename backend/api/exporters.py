@@ -0,0 +1,272 @@
+import csv
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import (Case, CharField, F, IntegerField, Sum, Value,
+                              When)
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from recipes.models import ShoppingListItem
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 12
+PDF_LEADING = 16
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+
+
+def _afii(letter):
+    """Имя глифа Adobe для кириллической буквы"""
+    if letter in "Ёё":
+        return "afii10023" if letter == "Ё" else "afii10071"
+    upper = letter.upper()
+    index = ord(upper) - ord("А")
+    number = 10017 + index + (index >= 6)
+    return f"afii{number + (48 if letter.islower() else 0)}"
+
+
+# Стандартный шрифт Helvetica не содержит кириллицы в WinAnsiEncoding,
+# поэтому текст кодируется в cp1251, а глифы переназначаются по именам.
+PDF_CYRILLIC_DIFFERENCES = " ".join(
+    [
+        f"{code} /{_afii(bytes([code]).decode('cp1251'))}"
+        for code in (0xA8, 0xB8)
+    ]
+    + [f"{0xC0} " + " ".join(
+        f"/{_afii(bytes([code]).decode('cp1251'))}"
+        for code in range(0xC0, 0x100)
+    )]
+)
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Параметр ?format= выбирает формат файла, а не рендерер DRF"""
+
+    def filter_renderers(self, renderers, format):
+        return renderers
+
+
+def shopping_cart_ingredients(user):
+    """Ингредиенты рецептов из корзины, суммированные по названию
+
+    Читается готовый список покупок пользователя (ShoppingListItem).
+    Единицы измерения приводятся к базовым по таблице UNIT_CONVERSIONS
+    на стороне БД, поэтому «1 кг» и «500 г» дают одну строку «1500 г».
+    """
+    conversions = settings.UNIT_CONVERSIONS
+    measurement_unit = Case(
+        *[
+            When(ingredient__measurement_unit=unit, then=Value(base_unit))
+            for unit, (base_unit, _) in conversions.items()
+        ],
+        default=F("ingredient__measurement_unit"),
+        output_field=CharField(),
+    )
+    amount = Case(
+        *[
+            When(ingredient__measurement_unit=unit, then=F("amount") * factor)
+            for unit, (_, factor) in conversions.items()
+        ],
+        default=F("amount"),
+        output_field=IntegerField(),
+    )
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(name=F("ingredient__name"), measurement_unit=measurement_unit)
+        .annotate(amount=Sum(amount))
+        .order_by("name", "measurement_unit")
+    )
+
+
+def shopping_cart_etag(request, *args, **kwargs):
+    """ETag — хэш содержимого списка покупок
+
+    Хэшируются все позиции списка вместе с названиями и единицами
+    измерения ингредиентов, поэтому любое изменение количества или
+    переименование ингредиента меняет ETag. Позиций у пользователя
+    немного, и они читаются по индексу одним запросом.
+    """
+    user = request.user
+    file_format = request.query_params.get("format", "txt")
+    if user.is_anonymous or file_format not in EXPORTERS:
+        return None
+    items = ShoppingListItem.objects.filter(user=user).order_by(
+        "ingredient_id"
+    ).values_list(
+        "ingredient_id",
+        "amount",
+        "ingredient__name",
+        "ingredient__measurement_unit",
+    )
+    digest = hashlib.md5(
+        "\n".join(
+            [file_format, user.username, user.first_name, user.last_name]
+        ).encode()
+    )
+    empty = True
+    for item in items:
+        empty = False
+        digest.update(json.dumps(item, ensure_ascii=False).encode())
+    return None if empty else digest.hexdigest()
+
+
+def _title(user):
+    return f"{user.first_name.title()}_{user.last_name.title()}"
+
+
+def export_txt(user, ingredients):
+    yield f"Список покупок для: {_title(user)}\n\n"
+    separator = ""
+    for ingredient in ingredients:
+        yield (
+            f'{separator}- {ingredient["name"]} '
+            f'({ingredient["measurement_unit"]})'
+            f' - {ingredient["amount"]}'
+        )
+        separator = "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(user, ingredients):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["name", "measurement_unit", "amount"])
+    for ingredient in ingredients:
+        yield writer.writerow(
+            [
+                ingredient["name"],
+                ingredient["measurement_unit"],
+                ingredient["amount"],
+            ]
+        )
+
+
+def export_json(user, ingredients):
+    yield "["
+    separator = ""
+    for ingredient in ingredients:
+        yield separator + json.dumps(ingredient, ensure_ascii=False)
+        separator = ","
+    yield "]"
+
+
+def _pdf_text(value):
+    encoded = value.encode("cp1251", errors="replace")
+    return (
+        encoded.replace(b"\\", b"\\\\")
+        .replace(b"(", b"\\(")
+        .replace(b")", b"\\)")
+    )
+
+
+def _pdf_lines(user, ingredients):
+    yield f"Список покупок для: {_title(user)}"
+    yield ""
+    for ingredient in ingredients:
+        yield (
+            f'- {ingredient["name"]} '
+            f'({ingredient["measurement_unit"]})'
+            f' - {ingredient["amount"]}'
+        )
+
+
+def _pdf_page_content(lines):
+    content = [
+        b"BT",
+        b"/F1 %d Tf" % PDF_FONT_SIZE,
+        b"%d TL" % PDF_LEADING,
+        b"%d %d Td" % (PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN),
+    ]
+    content += [b"(" + _pdf_text(line) + b") Tj T*" for line in lines]
+    content.append(b"ET")
+    return b"\n".join(content)
+
+
+def export_pdf(user, ingredients):
+    """Постраничная генерация PDF без внешних библиотек"""
+    offsets = {}
+    written = 0
+
+    def pdf_object(number, body):
+        nonlocal written
+        offsets[number] = written
+        chunk = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        written += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    written += len(header)
+    yield header
+    yield pdf_object(
+        3,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding "
+        b"/Differences [" + PDF_CYRILLIC_DIFFERENCES.encode() + b"] >> >>",
+    )
+    kids = []
+    number = 4
+    lines = []
+    for line in _pdf_lines(user, ingredients):
+        lines.append(line)
+        if len(lines) < PDF_LINES_PER_PAGE:
+            continue
+        yield from _pdf_page(pdf_object, number, lines)
+        kids.append(number + 1)
+        number += 2
+        lines = []
+    if lines or not kids:
+        yield from _pdf_page(pdf_object, number, lines)
+        kids.append(number + 1)
+    yield pdf_object(
+        2,
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)),
+    )
+    yield pdf_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    xref = [b"xref", b"0 %d" % (len(offsets) + 1), b"0000000000 65535 f "]
+    xref += [b"%010d 00000 n " % offsets[key] for key in sorted(offsets)]
+    yield b"\n".join(xref) + b"\n"
+    yield (
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(offsets) + 1, written)
+    )
+
+
+def _pdf_page(pdf_object, number, lines):
+    content = _pdf_page_content(lines)
+    yield pdf_object(
+        number,
+        b"<< /Length %d >>\nstream\n" % len(content)
+        + content + b"\nendstream",
+    )
+    yield pdf_object(
+        number + 1,
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+        % (PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, number),
+    )
+
+
+EXPORTERS = {
+    "txt": (export_txt, "text/plain; charset=utf-8"),
+    "csv": (export_csv, "text/csv; charset=utf-8"),
+    "json": (export_json, "application/json"),
+    "pdf": (export_pdf, "application/pdf"),
+}
+
+
+def create_file_shopping_cart(user, ingredients, file_format="txt"):
+    """Потоковая выгрузка ингредиентов рецептов из корзины"""
+    exporter, content_type = EXPORTERS[file_format]
+    response = StreamingHttpResponse(
+        exporter(user, ingredients.iterator()), content_type=content_type
+    )
+    filename = f"{user.username}_shopping_list.{file_format}"
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
@@ -1,30 +1,55 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Case, IntegerField, Value, When
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.cache import catalogue
+from api.serializers import TagSerializer
+from recipes.models import Ingredient, Recipe
 
 User = get_user_model()
 
 
+def tag_choices():
+    return [(tag["slug"], tag["name"]) for tag in catalogue(TagSerializer)]
+
+
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr="startswith")
+    name = filters.CharFilter(method="filter_name")
 
     class Meta:
         model = Ingredient
         fields = ["name"]
 
+    def filter_name(self, queryset, name, value):
+        """Автодополнение: сначала совпадения по началу названия,
+        затем по подстроке, не больше INGREDIENT_SEARCH_LIMIT"""
+        # LIKE в SQLite не учитывает регистр только для латиницы,
+        # а каталог ингредиентов хранится в нижнем регистре.
+        value = value.lower()
+        return queryset.filter(name__icontains=value).annotate(
+            rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by("rank", "name")[:settings.INGREDIENT_SEARCH_LIMIT]
+
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
+    search = filters.CharFilter(method="filter_search")
+    tags = filters.MultipleChoiceFilter(
         field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all(),
+        choices=tag_choices,
     )
 
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    ordering = filters.OrderingFilter(
+        fields=(("favorites_count", "popularity"),),
+    )
 
     class Meta:
         model = Recipe
@@ -33,6 +58,11 @@ class RecipeFilter(FilterSet):
             "author",
         )
 
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию, описанию и ингредиентам; явный ?ordering=
+        заменяет сортировку по релевантности"""
+        return queryset.search(value)
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from foodgram_backend.db.base import DatabaseWrapper, close_pool
+from foodgram_backend.profiling import PERCENTILES, percentile
+
+# Режим -> изменения настроек соединения
+MODES = {
+    "new": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "POOL_SIZE": 0},
+    "persistent": {
+        "CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": False, "POOL_SIZE": 0},
+    "persistent-checked": {
+        "CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True, "POOL_SIZE": 0},
+    "pool": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "POOL_SIZE": 4},
+    "pool-checked": {
+        "CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True, "POOL_SIZE": 4},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Задержка запроса к API с открытием нового соединения с БД, "
+        "с постоянным соединением и с пулом. Запрос имитируется сигналами "
+        "начала и конца запроса вокруг одного SELECT 1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            "--threads", action="store_true",
+            help="Каждый запрос в собственном потоке, как в режиме ASGI",
+        )
+        parser.add_argument(
+            "--modes", nargs="*", default=list(MODES), choices=list(MODES))
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        connection = connections[alias]
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in MODES["new"]}
+        # connection_created срабатывает и на соединение, выданное пулом,
+        # поэтому новые соединения драйвера считаются по самим объектам;
+        # ссылки на них не дают id повториться до конца замера.
+        opened = {}
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened[id(connection.connection)] = connection.connection
+
+        connection_created.connect(count_connection)
+        try:
+            for mode in options["modes"]:
+                if mode.startswith("pool") and not isinstance(
+                    connection, DatabaseWrapper
+                ):
+                    self.stdout.write(
+                        f"{mode:<20} пропущен: пул есть только у движка "
+                        "foodgram_backend.db")
+                    continue
+                if mode.startswith("persistent") and options["threads"]:
+                    self.stdout.write(
+                        f"{mode:<20} пропущен: соединение потока не "
+                        "переживает поток запроса")
+                    continue
+                connection.close()
+                settings_dict.update(MODES[mode])
+                opened.clear()
+                latencies = self.measure(
+                    alias, options["requests"], options["threads"])
+                self.stdout.write(
+                    f"{mode:<20} " + ", ".join(
+                        f"p{percent} {percentile(latencies, percent):.2f} мс"
+                        for percent in PERCENTILES
+                    ) + f", новых соединений: {len(opened)}"
+                )
+                connection.close()
+                close_pool(alias)
+        finally:
+            connection_created.disconnect(count_connection)
+            settings_dict.update(original)
+
+    def measure(self, alias, requests, threads):
+        latencies = []
+
+        def request():
+            start = time.perf_counter()
+            signals.request_started.send(sender=self.__class__)
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            finally:
+                signals.request_finished.send(sender=self.__class__)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        for _ in range(requests):
+            if threads:
+                thread = threading.Thread(target=request)
+                thread.start()
+                thread.join()
+            else:
+                request()
+        return latencies
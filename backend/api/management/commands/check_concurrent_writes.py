@@ -0,0 +1,137 @@
+import threading
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+
+from api.benchmark import BENCHMARK_PREFIX
+from recipes.models import Recipe, ShoppingListItem
+from users.models import User
+
+# Название, адрес и признак пакетного запроса с телом {"recipes": [id]}
+CASES = (
+    ("favorite", "/api/recipes/{recipe}/favorite/", False),
+    ("shopping_cart", "/api/recipes/{recipe}/shopping_cart/", False),
+    ("subscribe", "/api/users/{author}/subscribe/", False),
+    ("favorite_bulk", "/api/recipes/favorite/", True),
+    ("cart_bulk", "/api/recipes/shopping_cart/", True),
+)
+# Метод -> результат запроса, изменившего данные, и результат повторов:
+# статус ответа, а у пакетных запросов — статус рецепта в ответе
+EXPECTED = {"post": (201, 400), "delete": (204, 404)}
+EXPECTED_BULK = {
+    "post": ("added", "already_added"),
+    "delete": ("removed", "not_added"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Одновременные одинаковые запросы добавления и удаления в "
+        "избранном, корзине и подписках, в том числе пакетные: ровно один "
+        "запрос меняет данные, ошибок 500 нет, счётчики и список покупок "
+        "сходятся с записями. Команда создаёт "
+        "и затем удаляет своих пользователей и рецепт. Только PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=8)
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **options):
+        # SQLite допускает одного пишущего: одновременные транзакции
+        # получают «database is locked» независимо от кода API.
+        if connection.vendor != "postgresql":
+            raise CommandError("Проверка выполняется только на PostgreSQL")
+        setup_test_environment()
+        user, author, recipe = self.create_fixtures()
+        try:
+            failures = self.run_cases(user, author, recipe, options)
+            if Recipe.objects.filter(pk=recipe.pk).reconcile_counters():
+                failures.append("счётчики рецепта")
+            if ShoppingListItem.objects.rebuild([user.pk]):
+                failures.append("список покупок")
+        finally:
+            User.objects.filter(pk__in=(user.pk, author.pk)).delete()
+        if failures:
+            raise CommandError(
+                "Ошибки одновременных запросов: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            "Одновременные запросы обработаны без ошибок"))
+
+    def create_fixtures(self):
+        user, author = (
+            User.objects.create(
+                username=f"{BENCHMARK_PREFIX}concurrent_{role}",
+                email=f"{BENCHMARK_PREFIX}concurrent_{role}@example.com",
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for role in ("user", "author")
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f"{BENCHMARK_PREFIX}одновременный рецепт",
+            image="recipes/benchmark.png",
+            # Файла изображения нет, копии для него не строятся
+            image_variants={"source": "recipes/benchmark.png"},
+            text="Описание",
+            cooking_time=10,
+        )
+        return user, author, recipe
+
+    def run_cases(self, user, author, recipe, options):
+        clients, rounds = options["clients"], options["rounds"]
+        failures = []
+        for name, path, bulk in CASES:
+            path = path.format(recipe=recipe.pk, author=author.pk)
+            data = {"recipes": [recipe.pk]} if bulk else None
+            outcomes = {method: Counter() for method in EXPECTED}
+            for _ in range(rounds):
+                for method in EXPECTED:
+                    outcomes[method].update(
+                        self.fire(user, method, path, data, clients))
+            for method, (changed, repeated) in (
+                EXPECTED_BULK if bulk else EXPECTED
+            ).items():
+                expected = Counter({
+                    changed: rounds, repeated: rounds * (clients - 1)})
+                failed = outcomes[method] != expected
+                line = f"{method.upper():<7}{name:<15}" + ", ".join(
+                    f"{outcome}: {count}"
+                    for outcome, count in sorted(
+                        outcomes[method].items(), key=str)
+                )
+                self.stdout.write(self.style.ERROR(line) if failed else line)
+                if failed:
+                    failures.append(f"{method.upper()} {name}")
+        return failures
+
+    def fire(self, user, method, path, data, clients):
+        """Результаты clients одинаковых запросов, отправленных
+        одновременно"""
+        barrier = threading.Barrier(clients)
+        outcomes = []
+
+        def send():
+            client = APIClient()
+            client.raise_request_exception = False
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = getattr(client, method)(path, data, format="json")
+                if data is not None and response.status_code == 200:
+                    outcomes.append(response.json()["results"][0]["status"])
+                else:
+                    outcomes.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
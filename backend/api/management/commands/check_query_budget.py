@@ -0,0 +1,92 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings, setup_test_environment
+from rest_framework.test import APIClient
+
+from api.benchmark import (BUDGETS, INGREDIENTS_CSV, invalidate_caches,
+                           measure, seed_dataset)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверка количества запросов к БД и времени ответа маршрутов API "
+        "на синтетическом наборе данных. Все изменения откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=3000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Число GET-запросов: первый идёт мимо кэша, остальные — "
+                 "с прогретым кэшем",
+        )
+        parser.add_argument(
+            "--ingredients", default=str(INGREDIENTS_CSV),
+            help="CSV-файл каталога ингредиентов",
+        )
+        parser.add_argument(
+            "--time-scale", type=float, default=1.0,
+            help="Множитель бюджетов времени для медленных окружений",
+        )
+        parser.add_argument(
+            "--only", nargs="*", default=None,
+            help="Проверить только перечисленные маршруты",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                transaction.atomic():
+            failures = self.run_checks(options)
+            transaction.set_rollback(True)
+        # Кэш справочников и рецептов мог запомнить откаченные данные.
+        invalidate_caches()
+        if failures:
+            raise CommandError(
+                "Превышен бюджет: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Все бюджеты соблюдены"))
+
+    def run_checks(self, options):
+        context = seed_dataset(
+            users=options["users"],
+            recipes=options["recipes"],
+            seed=options["seed"],
+            ingredients_path=options["ingredients"],
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=context["viewer"]))
+        anonymous = APIClient()
+        failures = []
+        for budget in BUDGETS:
+            if options["only"] and budget.name not in options["only"]:
+                continue
+            cold, warm, elapsed = measure(
+                anonymous if budget.anonymous else client,
+                budget, context, options["repeat"],
+            )
+            max_cold = budget.max_cold_queries
+            if max_cold is None:
+                max_cold = budget.max_queries
+            max_ms = budget.max_ms * options["time_scale"]
+            failed = (
+                cold > max_cold
+                or warm is not None and warm > budget.max_queries
+                or elapsed > max_ms
+            )
+            if failed:
+                failures.append(budget.name)
+            line = (
+                f"{budget.name:<42} queries "
+                f"{'-' if warm is None else warm:>3}/{budget.max_queries:<3} "
+                f"cold {cold:>3}/{max_cold:<3} "
+                f"time {elapsed:>8.1f}/{max_ms:.0f} ms"
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if failed else line)
+        return failures
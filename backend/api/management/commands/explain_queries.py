@@ -0,0 +1,117 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.benchmark import INGREDIENTS_CSV, main_queries, seed_dataset
+from recipes.cache import RECIPES_VERSION, bump_version
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+# Строки плана, означающие чтение таблицы целиком, а не по индексу
+FULL_SCAN = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (?:TABLE )?(?!CONSTANT\b)(\w+)\b(?! USING)"),
+}
+# Поиск по подстроке в SQLite не может использовать индекс, в PostgreSQL
+# его обслуживают триграммный и полнотекстовый индексы из recipes.signals
+ALLOWED_SCANS = {
+    "sqlite": {"ingredients-search", "recipes-search"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Планы выполнения (EXPLAIN) основных запросов API. С --check "
+        "команда завершается ошибкой, если запрос читает таблицу целиком "
+        "вместо индекса."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int,
+            help="id пользователя, от имени которого строятся запросы",
+        )
+        parser.add_argument(
+            "--synthetic", action="store_true",
+            help="Построить планы на синтетическом наборе данных, "
+                 "который затем откатывается",
+        )
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=3000)
+        parser.add_argument(
+            "--analyze", action="store_true",
+            help="Выполнить запросы (EXPLAIN ANALYZE, только PostgreSQL)",
+        )
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Ошибка при полном просмотре таблиц",
+        )
+        parser.add_argument(
+            "--only", nargs="*", default=None,
+            help="Показать только перечисленные запросы",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            failures = self.explain(options)
+            transaction.set_rollback(True)
+        if options["synthetic"]:
+            # Кэш справочников и рецептов мог запомнить откаченные данные.
+            for model in (Ingredient, Tag):
+                bump_version(model._meta.model_name)
+            bump_version(RECIPES_VERSION)
+        if failures:
+            raise CommandError(
+                "Полный просмотр таблиц: " + ", ".join(failures))
+
+    def get_user(self, options):
+        if options["synthetic"]:
+            context = seed_dataset(
+                users=options["users"],
+                recipes=options["recipes"],
+                ingredients_path=INGREDIENTS_CSV,
+            )
+            # Статистика пустых до наполнения таблиц дала бы планы,
+            # которых на реальных данных не будет.
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            return User.objects.get(pk=context["viewer"])
+        if options["user"] is not None:
+            try:
+                return User.objects.get(pk=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f"Пользователь {options['user']} не найден")
+        user = User.objects.order_by("pk").first()
+        if user is None:
+            raise CommandError(
+                "В базе нет пользователей, используйте --synthetic")
+        return user
+
+    def explain(self, options):
+        user = self.get_user(options)
+        vendor = connection.vendor
+        explain_options = {}
+        if vendor == "postgresql":
+            if options["analyze"]:
+                explain_options["analyze"] = True
+            if options["check"]:
+                # Без последовательного чтения планировщик берёт любой
+                # подходящий индекс, и оставшийся Seq Scan означает, что
+                # такого индекса нет, а не что таблица пока мала.
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+        full_scan = FULL_SCAN.get(vendor)
+        allowed = ALLOWED_SCANS.get(vendor, set())
+        failures = []
+        for name, queryset in main_queries(user).items():
+            if options["only"] and name not in options["only"]:
+                continue
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            scans = sorted(set(full_scan.findall(plan))) if full_scan else []
+            if options["check"] and scans and name not in allowed:
+                failures.append(f"{name} ({', '.join(scans)})")
+        return failures
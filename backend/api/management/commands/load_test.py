@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_backend.profiling import PERCENTILES, percentile
+
+
+async def read_response(reader):
+    """Статус ответа HTTP/1.1 и можно ли продолжать соединение"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {
+        name.strip().lower(): value.strip()
+        for name, _, value in (line.partition(":") for line in lines[1:])
+        if name
+    }
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection", "").lower() != "close"
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест одного адреса: ответы в секунду и задержки при "
+        "заданном числе одновременных клиентов. Медленные клиенты передают "
+        "запрос по байту и держат соединения занятыми, как клиенты на "
+        "плохой сети."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--slow-clients", type=int, default=0)
+        parser.add_argument(
+            "--slow-interval", type=float, default=0.5,
+            help="Пауза медленного клиента между байтами запроса, с",
+        )
+        parser.add_argument(
+            "--header", action="append", default=[],
+            help="Дополнительный заголовок, например "
+                 "«Authorization: Token ...»",
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Поддерживаются только адреса http://")
+        self.host = url.hostname
+        self.port = url.port or 80
+        path = url.path or "/"
+        if url.query:
+            path = f"{path}?{url.query}"
+        self.request = "\r\n".join([
+            f"GET {path} HTTP/1.1",
+            f"Host: {url.netloc}",
+            "Accept: application/json",
+            *options["header"],
+            "", "",
+        ]).encode()
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.slow_responses = 0
+        elapsed = asyncio.run(self.run(options))
+        self.report(elapsed)
+
+    async def run(self, options):
+        deadline = time.perf_counter() + options["duration"]
+        slow = [
+            asyncio.ensure_future(
+                self.slow_client(deadline, options["slow_interval"]))
+            for _ in range(options["slow_clients"])
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(self.client(deadline) for _ in range(options["concurrency"])))
+        elapsed = time.perf_counter() - start
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return elapsed
+
+    async def client(self, deadline):
+        writer = None
+        while time.perf_counter() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        self.host, self.port)
+                start = time.perf_counter()
+                writer.write(self.request)
+                await writer.drain()
+                status, keep_alive = await read_response(reader)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                self.errors += 1
+                keep_alive = False
+            else:
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                self.statuses[status] += 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    async def slow_client(self, deadline, interval):
+        while time.perf_counter() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.port)
+                for position in range(len(self.request)):
+                    writer.write(self.request[position:position + 1])
+                    await writer.drain()
+                    await asyncio.sleep(interval)
+                await read_response(reader)
+                self.slow_responses += 1
+                writer.close()
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                await asyncio.sleep(interval)
+
+    def report(self, elapsed):
+        completed = len(self.latencies)
+        self.stdout.write(
+            f"Ответов: {completed} за {elapsed:.1f} с, "
+            f"{completed / elapsed:.1f} в секунду; ошибок: {self.errors}")
+        if completed:
+            self.stdout.write("Задержка, мс: " + ", ".join(
+                f"p{percent} {percentile(self.latencies, percent):.1f}"
+                for percent in PERCENTILES
+            ))
+        self.stdout.write("Статусы: " + ", ".join(
+            f"{status}: {count}"
+            for status, count in sorted(self.statuses.items())
+        ))
+        if self.slow_responses:
+            self.stdout.write(
+                f"Ответов медленным клиентам: {self.slow_responses}")
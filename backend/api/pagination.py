@@ -0,0 +1,49 @@
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Пагинация по ключу: следующая страница выбирается условием по
+    индексированному полю, без COUNT(*) и OFFSET
+
+    Ключ берётся из keyset_ordering представления (по умолчанию — порядок
+    ленты рецептов). Курсор с другим порядком запроса (?ordering=, поиск,
+    подбор по ингредиентам) отклоняется: страницы по ключу с ним не
+    совпали бы.
+    """
+
+    ordering = ("-pub_date", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        if queryset.query.order_by and (
+            tuple(queryset.query.order_by) != ordering
+        ):
+            raise serializers.ValidationError(
+                {self.cursor_query_param: "Курсор нельзя сочетать с "
+                                          "сортировкой этого запроса."},
+            )
+        return ordering
+
+
+class PageNumberOrCursorPagination(PageNumberPagination):
+    """Постраничная пагинация, а при наличии ?cursor= — пагинация по ключу
+
+    Первая страница запрашивается с пустым курсором (?cursor=), дальше
+    клиент переходит по ссылкам next/previous из ответа.
+    """
+
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_query_param = self.keyset_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,42 @@
+import json
+
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data, в котором составные поля переданы строками JSON
+
+    Изображение рецепта передаётся файлом, который Django при размере
+    больше FILE_UPLOAD_MAX_MEMORY_SIZE пишет во временный файл на диске,
+    а ingredients и tags — строками вида '[{"id": 1, "amount": 10}]'
+    или повторёнными полями. Как JSON разбираются только поля из
+    list_fields, и они всегда остаются списками, даже если передано одно
+    значение; остальные поля передаются как есть.
+    """
+
+    list_fields = ("ingredients", "tags")
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        data = {}
+        for key, values in parsed.data.lists():
+            if key not in self.list_fields:
+                data[key] = values if len(values) > 1 else values[0]
+                continue
+            values = [self.decode(value) for value in values]
+            if len(values) == 1 and isinstance(values[0], list):
+                data[key] = values[0]
+            else:
+                data[key] = values
+        # Request.data дополняется файлами через dict.update, поэтому
+        # файлы тоже передаются обычным словарём, а не MultiValueDict.
+        return DataAndFiles(data, parsed.files.dict())
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, str) and value[:1] in ("[", "{"):
+            try:
+                return json.loads(value)
+            except ValueError:
+                pass
+        return value
@@ -1,16 +1,93 @@
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import router, transaction
 from django.db.models import F
-from django.db import transaction
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields.fields import Base64ImageField, HybridImageField
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueValidator
 
-from api.validators import validate_username
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from api.cache import catalogue
+from api.validators import validate_recipes_limit, validate_username
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingListItem, Tag, build_search_document)
 from users.models import Subscribes, User
 
 
+def context_user(context):
+    """Пользователь, для которого строится представление
+
+    Общее для всех пользователей представление строится с анонимным
+    пользователем в context["user"].
+    """
+    return context.get("user") or context.get("request").user
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения рецепта
+
+    Пока копии не построены или построены для прежнего изображения,
+    возвращается пустой словарь, и клиент использует исходное изображение
+    из поля image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        value = super().get_attribute(instance) or {}
+        if value.get("source") != instance.image.name:
+            return {}
+        return value
+
+    def to_representation(self, value):
+        request = self.context.get("request")
+        variants = {}
+        for variant, formats in value.items():
+            if variant == "source":
+                continue
+            variants[variant] = {}
+            for extension, path in formats.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[variant][extension] = url
+        return variants
+
+
+class RecipeImageField(HybridImageField):
+    """Изображение рецепта строкой base64 или файлом multipart/form-data
+
+    Размер файла проверяется до декодирования base64, а число пикселей —
+    по заголовку изображения, до декодирования самих пикселей.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            size = len(data) * 3 // 4
+        else:
+            size = getattr(data, "size", 0)
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                "Размер изображения не должен превышать "
+                f"{settings.RECIPE_IMAGE_MAX_SIZE // 2 ** 20} МБ!"
+            )
+        image_file = super().to_internal_value(data)
+        if not isinstance(data, str):
+            extension = image_file.image.format.lower()
+            image_file.name = f"{uuid.uuid4()}.{extension}"
+        width, height = image_file.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                "Разрешение изображения не должно превышать "
+                f"{settings.RECIPE_IMAGE_MAX_PIXELS // 10 ** 6} Мп!"
+            )
+        return image_file
+
+
 class UsersSerializer(UserSerializer):
     """Сериализация пользователей"""
 
@@ -29,9 +106,13 @@ class UsersSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Проверка подписки"""
-        user = self.context.get("request").user
-        return not user.is_anonymous and Subscribes.objects.filter(
-            user=user, author=obj).exists()
+        user = context_user(self.context)
+        if user.is_anonymous:
+            return False
+        is_subscribed = getattr(obj, "is_subscribed", None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return Subscribes.objects.filter(user=user, author=obj).exists()
 
 
 class UsersCreateSerializer(UserSerializer):
@@ -66,6 +147,21 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class TagPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Тэг по id из закэшированного справочника без запроса к БД"""
+
+    def to_internal_value(self, data):
+        tags = {tag["id"]: tag for tag in catalogue(TagSerializer)}
+        try:
+            tag = tags[int(data)]
+            return Tag.from_db(
+                router.db_for_write(Tag), list(tag), list(tag.values()))
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализация ингредиентов"""
 
@@ -89,17 +185,33 @@ class RecipeSerializer(serializers.ModelSerializer):
     """Сериализация рецепта"""
 
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ["id", "name", "image", "cooking_time"]
+        fields = ["id", "name", "image", "image_variants", "cooking_time"]
         read_only_fields = ("__all__",)
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного изменения избранного или корзины"""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        # Повторы схлопываются, порядок ответа повторяет порядок запроса
+        return list(dict.fromkeys(value))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализация имеющегося рецепта"""
 
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     author = UsersSerializer()
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
@@ -117,11 +229,29 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         ]
 
+    def to_representation(self, instance):
+        author_is_subscribed = getattr(
+            instance, "author_is_subscribed", None)
+        if author_is_subscribed is not None:
+            instance.author.is_subscribed = author_is_subscribed
+        return super().to_representation(instance)
+
     def get_ingredients(self, obj):
+        if "recipe" in getattr(obj, "_prefetched_objects_cache", {}):
+            return [
+                {
+                    "id": item.ingredient.id,
+                    "name": item.ingredient.name,
+                    "measurement_unit": item.ingredient.measurement_unit,
+                    "amount": item.amount,
+                }
+                for item in obj.recipe.all()
+            ]
         ingredients = obj.ingredients.values(
             "id", "name", "measurement_unit",
             amount=F("ingredient_in_recipe__amount")
@@ -129,23 +259,43 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return ingredients
 
     def get_is_favorited(self, obj):
-        user = self.context.get("request").user
-        return not user.is_anonymous and user.favorite_user.filter(
-            recipe=obj).exists()
+        user = context_user(self.context)
+        if user.is_anonymous:
+            return False
+        is_favorited = getattr(obj, "is_favorited", None)
+        if is_favorited is not None:
+            return is_favorited
+        return user.favorite_user.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get("request").user
-        return not user.is_anonymous and user.shopping_cart.filter(
-            recipe=obj).exists()
+        user = context_user(self.context)
+        if user.is_anonymous:
+            return False
+        is_in_shopping_cart = getattr(obj, "is_in_shopping_cart", None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
+        return user.shopping_cart.filter(recipe=obj).exists()
+
+
+class CookableRecipeSerializer(RecipeReadSerializer):
+    """Рецепт с числом имеющихся и недостающих ингредиентов"""
+
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + [
+            "matched_count",
+            "missing_count",
+        ]
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализация создания рецепта"""
 
     author = serializers.CharField(default=serializers.CurrentUserDefault())
-    image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all())
+    image = RecipeImageField()
+    tags = TagPrimaryKeyField(many=True, queryset=Tag.objects.all())
     ingredients = IngredientInRecipeSerializer(many=True)
 
     class Meta:
@@ -166,7 +316,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         IngredientInRecipe.objects.bulk_create(
             [
                 IngredientInRecipe(
-                    ingredient=Ingredient.objects.get(id=ingredient["id"]),
+                    ingredient_id=ingredient["id"],
                     recipe=recipe,
                     amount=ingredient["amount"],
                 )
@@ -174,10 +324,54 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             ]
         )
 
+    @staticmethod
+    def ingredient_update(recipe, ingredients):
+        """Изменение только тех ингредиентов рецепта, которые отличаются
+
+        Если состав изменился, списки покупок с этим рецептом в корзине
+        пересчитываются: старые ингредиенты вычитаются, новые прибавляются.
+        """
+        amounts = {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        changed = []
+        removed = []
+        for item in IngredientInRecipe.objects.filter(recipe=recipe):
+            amount = amounts.pop(item.ingredient_id, None)
+            if amount is None:
+                removed.append(item.pk)
+            elif item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if not (changed or removed or amounts):
+            return
+        in_carts = Recipe.objects.filter(pk=recipe.pk)
+        ShoppingListItem.objects.add_carts(in_carts, sign=-1)
+        if removed:
+            IngredientInRecipe.objects.filter(pk__in=removed).delete()
+        IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        RecipeWriteSerializer.ingredient_create(
+            recipe,
+            [
+                {"id": ingredient_id, "amount": amount}
+                for ingredient_id, amount in amounts.items()
+            ],
+        )
+        ShoppingListItem.objects.add_carts(in_carts)
+
+    @staticmethod
+    def search_document(name, text, ingredients):
+        return build_search_document(
+            name, text, [ingredient["name"] for ingredient in ingredients])
+
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
+        validated_data["search_document"] = self.search_document(
+            validated_data["name"], validated_data["text"], ingredients)
+        validated_data["ingredients_count"] = len(ingredients)
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.ingredient_create(recipe, ingredients)
@@ -187,12 +381,15 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
+        validated_data["search_document"] = self.search_document(
+            validated_data.get("name", instance.name),
+            validated_data.get("text", instance.text),
+            ingredients,
+        )
+        validated_data["ingredients_count"] = len(ingredients)
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.ingredient_create(instance, ingredients)
-        instance.save()
+        self.ingredient_update(instance, ingredients)
         return instance
 
     def to_representation(self, instance):
@@ -200,6 +397,28 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         context = {"request": request}
         return RecipeReadSerializer(instance, context=context).data
 
+    def validate_ingredients(self, value):
+        ids = [ingredient["id"] for ingredient in value]
+        if not ids:
+            raise serializers.ValidationError(
+                "Нужно указать хотя бы один ингредиент!",
+            )
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                "Ингредиенты не должны повторяться!",
+            )
+        found = Ingredient.objects.in_bulk(ids)
+        missing = set(ids) - found.keys()
+        if missing:
+            raise serializers.ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(str(pk) for pk in sorted(missing)),
+            )
+        # Названия нужны для поискового документа рецепта
+        for ingredient in value:
+            ingredient["name"] = found[ingredient["id"]].name
+        return value
+
     def validate_cooking_time(self, value):
         time = value
         if time == 0:
@@ -238,34 +457,28 @@ class SubscribesSerializer(UsersSerializer):
         author = self.context.get("author")
         user = self.context.get("user")
         if self.context.get("request").method == "POST":
+            # Повторную подписку отклоняет сама вставка в subscribe,
+            # без отдельного запроса на проверку.
             if author == user:
                 raise serializers.ValidationError(
                     "Нельзя подписаться на самого себя!",
                 )
-            elif Subscribes.objects.filter(
-                author=author, user=user
-            ).exists():
-                raise serializers.ValidationError(
-                    "Вы уже подписаны!",
-                )
         return value
 
-    def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        return not user.is_anonymous and Subscribes.objects.filter(
-            user=user, author=obj).exists()
-
     def get_recipes_count(self, obj):
+        recipes_count = getattr(obj, "recipes_count", None)
+        if recipes_count is not None:
+            return recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit", "")
-        recipes = obj.recipes.all()
-        if limit:
-            if not (limit.isdigit()):
-                raise ValidationError(
-                    {"recipes_limit": "Может быть только числом!"})
-            recipes = recipes[: int(limit)]
+        recipes = getattr(obj, "feed_recipes", None)
+        if recipes is None:
+            request = self.context.get("request")
+            limit = validate_recipes_limit(
+                request.GET.get("recipes_limit", ""))
+            recipes = obj.recipes.all()
+            if limit is not None:
+                recipes = recipes[:limit]
         serializer = RecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (IngredientViewSet,
+                       ProfilingView,
                        RecipeViewSet,
                        TagViewSet,
                        UsersViewSet)
@@ -13,6 +15,12 @@ router.register("ingredients", IngredientViewSet, basename="ingredients")
 router.register("users", UsersViewSet, basename="subscriptions")
 
 urlpatterns = [
+    path("profiling/", ProfilingView.as_view(), name="profiling"),
     path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
 ]
+
+if settings.ASYNC_VIEWS:
+    from api import async_views
+
+    urlpatterns = async_views.urlpatterns + urlpatterns
@@ -14,3 +14,41 @@ def validate_username(value: str) -> str:
             "Имя пользователя некорректно.",
         )
     return value
+
+
+def validate_ingredient_ids(values: list):
+    """Валидация параметра ingredients: список id ингредиентов."""
+
+    if not values:
+        raise serializers.ValidationError(
+            {"ingredients": "Нужно указать хотя бы один ингредиент!"},
+        )
+    if not all(value.isdigit() for value in values):
+        raise serializers.ValidationError(
+            {"ingredients": "Может быть только числом!"},
+        )
+    return {int(value) for value in values}
+
+
+def validate_max_missing(value: str) -> int:
+    """Валидация параметра max_missing."""
+
+    if not value:
+        return 0
+    if not value.isdigit():
+        raise serializers.ValidationError(
+            {"max_missing": "Может быть только числом!"},
+        )
+    return int(value)
+
+
+def validate_recipes_limit(value: str):
+    """Валидация параметра recipes_limit."""
+
+    if not value:
+        return None
+    if not value.isdigit():
+        raise serializers.ValidationError(
+            {"recipes_limit": "Может быть только числом!"},
+        )
+    return int(value)
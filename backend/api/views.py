@@ -1,31 +1,61 @@
-from django.db.models import Sum
+from functools import partial
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import (BooleanField, Count, F, Prefetch, Value,
+                              prefetch_related_objects)
+from django.db.models.functions import Greatest
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 
+from api.cache import catalogue, catalogue_etag, shared_recipes_response
+from api.exporters import (
+    EXPORTERS,
+    IgnoreFormatContentNegotiation,
+    create_file_shopping_cart,
+    shopping_cart_etag,
+    shopping_cart_ingredients,
+)
 from api.filters import IngredientFilter, RecipeFilter
+from api.parsers import MultiPartJSONParser
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
 from api.serializers import (
+    CookableRecipeSerializer,
     IngredientSerializer,
+    RecipeIdsSerializer,
     RecipeReadSerializer,
     RecipeSerializer,
     RecipeWriteSerializer,
     SubscribesSerializer,
     TagSerializer,
 )
-from api.utils import create_file_shopping_cart
+from api.validators import (validate_ingredient_ids, validate_max_missing,
+                            validate_recipes_limit)
+from foodgram_backend.db.utils import (bulk_insert_ignoring_conflicts,
+                                       delete_returning,
+                                       insert_ignoring_conflicts)
+from foodgram_backend.metrics import observe_write
+from foodgram_backend.profiling import stats
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Subscribes, User
@@ -38,6 +68,60 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrReadOnly | IsAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    parser_classes = (JSONParser, MultiPartJSONParser)
+    lookup_value_regex = r"\d+"
+
+    shared_payload = False
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.with_related().with_user_flags(
+                self.get_payload_user())
+        return Recipe.objects.all()
+
+    def get_payload_user(self):
+        """Пользователь, для которого строится представление рецептов"""
+        if self.shared_payload:
+            return AnonymousUser()
+        return self.request.user
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user"] = self.get_payload_user()
+        return context
+
+    def is_shared_cacheable(self, request):
+        """Ответ не зависит от пользователя, кроме его признаков рецептов"""
+        if request.accepted_renderer.format != "json":
+            return False
+        return request.user.is_anonymous or not any(
+            request.query_params.get(name)
+            for name in ("is_favorited", "is_in_shopping_cart")
+        )
+
+    def build_shared(self, handler, request, *args, **kwargs):
+        self.shared_payload = True
+        try:
+            return handler(request, *args, **kwargs)
+        finally:
+            self.shared_payload = False
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_shared_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        return shared_recipes_response(
+            request,
+            partial(self.build_shared, super().list, request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_shared_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        return shared_recipes_response(
+            request,
+            partial(
+                self.build_shared, super().retrieve, request, *args, **kwargs),
+        )
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -47,67 +131,180 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    @action(detail=True, methods=["POST", "DELETE"], name="favorite")
-    def favorite(self, request, *args, **kwargs):
-        """Добавить/удалить рецепт в избранное"""
+    def toggle_membership(self, request, model, counter, kind):
+        """Добавление или удаление рецепта в избранном или корзине
+
+        Запись меняется одним INSERT … ON CONFLICT DO NOTHING или DELETE,
+        и повторный, в том числе одновременный, запрос получает 400 или
+        404 по числу изменённых строк, а не IntegrityError.
+        """
         recipe_id = self.kwargs.get("pk")
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        user = request.user
         if request.method == "POST":
-            if Favorite.objects.filter(
-                user=request.user, recipe__id=recipe_id
-            ).exists():
+            recipe = get_object_or_404(Recipe, pk=recipe_id)
+            if not insert_ignoring_conflicts(model(user=user, recipe=recipe)):
                 return Response(
                     {"errors": "Рецепт уже добавлен!"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            Favorite.objects.create(recipe=recipe, user=self.request.user)
+            delta, write = 1, "add"
+        else:
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=recipe_id).delete()
+            if not deleted:
+                raise Http404
+            delta, write = -1, "remove"
+        # Счётчик может отставать от записей до reconcile_counters,
+        # а поле положительное: уменьшение не опускает его ниже нуля
+        Recipe.objects.filter(pk=recipe_id).update(
+            **{counter: Greatest(F(counter) + delta, 0)})
+        # После счётчика: изменение состава рецепта ждёт эту транзакцию
+        # на блокировке строки рецепта и видит корзину уже изменённой
+        if model is ShoppingCart:
+            ShoppingListItem.objects.add_recipes(
+                user.pk, [recipe_id], delta)
+        observe_write(kind, write)
+        if request.method == "POST":
             serializer = RecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            instance = get_object_or_404(
-                Favorite, recipe=recipe, user=self.request.user
-            )
-            instance.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["POST", "DELETE"], name="favorite")
+    @transaction.atomic
+    def favorite(self, request, *args, **kwargs):
+        """Добавить/удалить рецепт в избранное"""
+        return self.toggle_membership(
+            request, Favorite, "favorites_count", "favorite")
 
     @action(detail=True, methods=["POST", "DELETE"], name="Shopping_cart")
+    @transaction.atomic
     def shopping_cart(self, request, *args, **kwargs):
         """Добавить/убрать рецепт в корзину"""
-        recipe_id = self.kwargs.get("pk")
+        return self.toggle_membership(
+            request, ShoppingCart, "in_carts_count", "shopping_cart")
+
+    def bulk_membership(self, request, model, counter, kind):
+        """Пакетное добавление или удаление рецептов в избранном или
+        корзине; в ответе — что произошло с каждым рецептом
+
+        Изменёнными считаются рецепты, которые вернул сам INSERT или
+        DELETE (RETURNING), поэтому одновременные одинаковые запросы не
+        меняют счётчики и списки покупок дважды.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["recipes"]
         user = request.user
+        found = set(
+            Recipe.objects.filter(pk__in=ids).values_list("pk", flat=True))
         if request.method == "POST":
-            if ShoppingCart.objects.filter(
-                user=user, recipe__id=recipe_id
-            ).exists():
-                return Response(
-                    {"errors": "Рецепт уже добавлен!"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            recipe = get_object_or_404(Recipe, id=recipe_id)
-            ShoppingCart.objects.create(user=user, recipe=recipe)
-            serializer = RecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            changed = bulk_insert_ignoring_conflicts(
+                [model(user=user, recipe_id=pk) for pk in ids if pk in found],
+                returning="recipe",
+            )
+            delta, write, done, skipped = 1, "add", "added", "already_added"
         else:
-            instance = get_object_or_404(
-                ShoppingCart, user=user, recipe__id=recipe_id)
-            instance.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            changed = delete_returning(
+                model.objects.filter(user=user, recipe_id__in=found),
+                returning="recipe",
+            )
+            delta, write, done, skipped = -1, "remove", "removed", "not_added"
+        if changed:
+            Recipe.objects.filter(pk__in=changed).update(
+                **{counter: Greatest(F(counter) + delta, 0)})
+            if model is ShoppingCart:
+                ShoppingListItem.objects.add_recipes(user.pk, changed, delta)
+        observe_write(kind, write, count=len(changed))
+        statuses = {pk: done for pk in changed}
+        return Response({
+            "results": [
+                {
+                    "id": pk,
+                    "status": statuses.get(
+                        pk, "not_found" if pk not in found else skipped),
+                }
+                for pk in ids
+            ]
+        })
 
-    @action(detail=False, methods=["GET"], name="Download Shopping_cart")
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="favorite",
+        url_name="favorite-bulk",
+        name="Favorite bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    @transaction.atomic
+    def favorite_bulk(self, request, *args, **kwargs):
+        """Пакетно добавить/удалить рецепты в избранное:
+        {"recipes": [<id>, ...]}"""
+        return self.bulk_membership(
+            request, Favorite, "favorites_count", "favorite")
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="shopping_cart",
+        url_name="shopping-cart-bulk",
+        name="Shopping_cart bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    @transaction.atomic
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        """Пакетно добавить/убрать рецепты в корзину:
+        {"recipes": [<id>, ...]}"""
+        return self.bulk_membership(
+            request, ShoppingCart, "in_carts_count", "shopping_cart")
+
+    @action(detail=False, methods=["GET"], name="Cookable")
+    def cookable(self, request, *args, **kwargs):
+        """Рецепты из имеющихся ингредиентов: ?ingredients=<id>&...
+        &max_missing=<сколько можно докупить>; фильтры списка рецептов
+        тоже применяются"""
+        ingredient_ids = validate_ingredient_ids(
+            request.query_params.getlist("ingredients"))
+        max_missing = validate_max_missing(
+            request.query_params.get("max_missing", ""))
+        queryset = self.filter_queryset(
+            self.get_queryset().cookable(ingredient_ids, max_missing))
+        page = self.paginate_queryset(queryset)
+        serializer = CookableRecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        name="Shopping list",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_list(self, request, *args, **kwargs):
+        """Текущий список покупок по рецептам из корзины"""
+        return Response(list(shopping_cart_ingredients(request.user)))
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        name="Download Shopping_cart",
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatContentNegotiation,
+    )
+    @method_decorator(etag(shopping_cart_etag))
     def download_shopping_cart(self, request, *args, **kwargs):
         """Скачать файл с ингредиентами рецептов из корзины"""
         user = request.user
+        file_format = request.query_params.get("format", "txt")
+        if file_format not in EXPORTERS:
+            return Response(
+                {"format": f"Доступные форматы: {', '.join(EXPORTERS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         if not user.shopping_cart.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = (
-            IngredientInRecipe.objects.filter(
-                recipe__shopping_cart__user=user
-            )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
+        return create_file_shopping_cart(
+            user, shopping_cart_ingredients(user), file_format
         )
-        response = create_file_shopping_cart(user, ingredients)
-        return response
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -118,6 +315,14 @@ class TagViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
+    @method_decorator(etag(catalogue_etag(Tag)))
+    def list(self, request, *args, **kwargs):
+        return Response(catalogue(TagSerializer))
+
+    @method_decorator(etag(catalogue_etag(Tag)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     """Представление ингредиентов"""
@@ -129,6 +334,16 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    @method_decorator(etag(catalogue_etag(Ingredient)))
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("name"):
+            return super().list(request, *args, **kwargs)
+        return Response(catalogue(IngredientSerializer))
+
+    @method_decorator(etag(catalogue_etag(Ingredient)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class UsersViewSet(DjoserUserViewSet):
     """Представление пользователей и подписок"""
@@ -136,6 +351,7 @@ class UsersViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
     serializer_class = SubscribesSerializer
     permission_classes = (IsAuthenticated,)
+    keyset_ordering = ("username",)
 
     @action(
         detail=False,
@@ -145,8 +361,25 @@ class UsersViewSet(DjoserUserViewSet):
     )
     def subscriptions(self, request):
         """Список пользователей, на которых подписан юзер"""
+        limit = validate_recipes_limit(
+            request.query_params.get("recipes_limit", ""))
+        # Запрос с GROUP BY не получает порядок из Meta.ordering
         pages = self.paginate_queryset(
-            User.objects.filter(subscribed__user=request.user)
+            User.objects.filter(subscribed__user=request.user).annotate(
+                recipes_count=Count("recipes", distinct=True),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ).order_by("username")
+        )
+        recipes = Recipe.objects.filter(author__in=pages)
+        if limit is not None:
+            recipes = recipes.top_per_author(limit)
+        prefetch_related_objects(
+            pages,
+            Prefetch(
+                "recipes",
+                queryset=recipes.order_by("-id"),
+                to_attr="feed_recipes",
+            ),
         )
         serializer = SubscribesSerializer(
             pages, context={"request": request}, many=True
@@ -157,21 +390,37 @@ class UsersViewSet(DjoserUserViewSet):
     def subscribe(self, request, *args, **kwargs):
         """Подписаться/отписаться от пользователя"""
         subscribed_id = self.kwargs.get("id")
-        author = get_object_or_404(User, pk=subscribed_id)
         if request.method == "POST":
+            author = get_object_or_404(User, pk=subscribed_id)
             serializer = SubscribesSerializer(
                 author, context={"request": request,
                                  "author": author,
                                  "user": self.request.user
                                  }, data=request.data
             )
-            if serializer.is_valid(raise_exception=True):
-                Subscribes.objects.create(
-                    author=author, user=self.request.user)
+            serializer.is_valid(raise_exception=True)
+            if not insert_ignoring_conflicts(
+                Subscribes(author=author, user=self.request.user)
+            ):
+                raise ValidationError({"username": ["Вы уже подписаны!"]})
+            observe_write("subscription", "add")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            instance = get_object_or_404(
-                Subscribes, author=author, user=request.user
-            )
-            instance.delete()
+        deleted, _ = Subscribes.objects.filter(
+            author_id=subscribed_id, user=request.user).delete()
+        if not deleted:
+            raise Http404
+        observe_write("subscription", "remove")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfilingView(APIView):
+    """Перцентили времени ответа и запросов к БД по представлениям"""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(stats.snapshot())
+
+    def delete(self, request):
+        stats.reset()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,7 +1,18 @@
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram_backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """Синхронный код каждого запроса выполняется в собственном потоке
+
+    Без ThreadSensitiveContext Django 3.2 выполняет синхронные
+    представления всех запросов процесса в одном общем потоке.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -0,0 +1,162 @@
+import threading
+from collections import deque
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+Database = base.Database
+
+# Пулы соединений процесса по псевдонимам БД. Создаются при первом
+# подключении, то есть уже в воркере gunicorn после fork.
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений psycopg2, общий для потоков процесса
+
+    Если все size соединений заняты, поток ждёт освобождения не дольше
+    timeout секунд.
+    """
+
+    def __init__(self, size, timeout):
+        self.timeout = timeout
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, connect, check=None):
+        """Свободное соединение из пула или новое
+
+        Соединение из пула, не прошедшее check, закрывается и заменяется.
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(
+                "Нет свободных соединений в пуле")
+        try:
+            while True:
+                with self.lock:
+                    connection = self.idle.pop() if self.idle else None
+                if connection is None:
+                    return connect()
+                if not connection.closed and (
+                    check is None or check(connection)
+                ):
+                    return connection
+                connection.close()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection, discard=False):
+        try:
+            if not (discard or connection.closed):
+                status = connection.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            if discard:
+                connection.close()
+            else:
+                with self.lock:
+                    self.idle.append(connection)
+        except Database.Error:
+            connection.close()
+        finally:
+            self.slots.release()
+
+
+def close_pool(alias):
+    """Закрытие свободных соединений пула; занятые закрываются владельцами"""
+    with pools_lock:
+        pool = pools.pop(alias, None)
+    if pool is not None:
+        with pool.lock:
+            while pool.idle:
+                pool.idle.pop().close()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с проверкой соединений и пулом
+
+    CONN_HEALTH_CHECKS: переиспользуемое соединение (CONN_MAX_AGE или пул)
+    проверяется запросом SELECT 1 при первом обращении в каждом запросе
+    к API, разорванное соединение заменяется новым, как в Django 4.1.
+    POOL_SIZE: соединения берутся из пула процесса и возвращаются в него
+    при закрытии; POOL_TIMEOUT — ожидание свободного соединения, с.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get("CONN_HEALTH_CHECKS", False)
+
+    def get_pool(self):
+        size = self.settings_dict.get("POOL_SIZE", 0)
+        if not size:
+            return None
+        with pools_lock:
+            pool = pools.get(self.alias)
+            if pool is None:
+                pool = pools[self.alias] = ConnectionPool(
+                    size, self.settings_dict.get("POOL_TIMEOUT", 10))
+        return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        connect = partial(super().get_new_connection, conn_params)
+        if pool is None:
+            return connect()
+        # Соединение могло быть разорвано, пока лежало в пуле без дела.
+        return pool.acquire(
+            connect,
+            check=self.check_usable if self.health_check_enabled else None,
+        )
+
+    def check_usable(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except Database.Error:
+            return False
+        return True
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+        ):
+            return
+        self.health_check_done = True
+        if not self.is_usable():
+            self.close()
+
+    def _cursor(self, name=None):
+        # Проверка до ensure_connection, как в Django 4.1: сам
+        # ensure_connection вызывается и изнутри connect.
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается сигналами начала и конца запроса к API.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Закрытое внутри atomic соединение остаётся в self.connection,
+            # поэтому в пул оно не возвращается.
+            pool.release(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,65 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, router
+from django.db.models import AutoField
+from django.db.models.sql import DeleteQuery, InsertQuery
+
+
+def insert_ignoring_conflicts(obj, using=None):
+    """Вставка obj одним INSERT … ON CONFLICT DO NOTHING
+
+    Возвращает True, если строка добавлена, и False, если такая строка
+    уже есть. Одновременные одинаковые вставки не получают IntegrityError
+    от уникального ограничения. pk у obj не заполняется.
+    """
+    return bool(bulk_insert_ignoring_conflicts([obj], using=using))
+
+
+def bulk_insert_ignoring_conflicts(objs, returning=None, using=None):
+    """Вставка objs одним INSERT … ON CONFLICT DO NOTHING … RETURNING
+
+    Возвращает значения поля returning (по умолчанию pk) только у
+    добавленных строк, поэтому из одновременных одинаковых вставок каждую
+    строку получает ровно одна. RETURNING есть в PostgreSQL и SQLite 3.35+.
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    using = using or router.db_for_write(model, instance=objs[0])
+    connection = connections[using]
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, AutoField)
+    ]
+    query = InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(fields, objs)
+    (sql, params), = query.get_compiler(using=using).as_sql()
+    field = model._meta.get_field(returning) if returning else model._meta.pk
+    return _execute_returning(connection, sql, params, field)
+
+
+def delete_returning(queryset, returning):
+    """Удаление строк queryset одним DELETE … RETURNING
+
+    Возвращает значения поля returning удалённых строк: из одновременных
+    одинаковых удалений строку получает ровно одно. Сигналы и каскады
+    не выполняются, поэтому подходит только для моделей без зависимых
+    записей.
+    """
+    query = queryset.query.chain(DeleteQuery)
+    try:
+        sql, params = query.get_compiler(using=queryset.db).as_sql()
+    except EmptyResultSet:
+        # Условие заведомо пустое (например, pk__in=[]): удалять нечего
+        return []
+    return _execute_returning(
+        connections[queryset.db], sql, params,
+        queryset.model._meta.get_field(returning))
+
+
+def _execute_returning(connection, sql, params, field):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{sql} RETURNING {connection.ops.quote_name(field.column)}",
+            params,
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,84 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# При заданной PROMETHEUS_MULTIPROC_DIR значения пишутся в файлы каталога,
+# общие для всех воркеров gunicorn, и суммируются при чтении
+# (см. gunicorn.conf.py).
+MULTIPROCESS_DIR = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUESTS = Counter(
+    "foodgram_http_requests_total",
+    "Число обработанных запросов",
+    ("method", "view", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "foodgram_http_request_duration_seconds",
+    "Время ответа",
+    ("method", "view"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    "foodgram_db_queries_per_request",
+    "Число запросов к БД на запрос",
+    ("method", "view"),
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 20, 50, 100),
+)
+DB_DURATION = Histogram(
+    "foodgram_db_duration_seconds",
+    "Суммарное время запросов к БД на запрос",
+    ("method", "view"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+CACHE_REQUESTS = Counter(
+    "foodgram_cache_requests_total",
+    "Обращения к кэшу рецептов и справочников",
+    ("cache", "result"),
+)
+WRITES = Counter(
+    "foodgram_writes_total",
+    "Изменения избранного, корзин и подписок",
+    ("kind", "action"),
+)
+
+
+def observe_request(method, view, status, duration, queries, db_duration):
+    REQUESTS.labels(method, view, status).inc()
+    REQUEST_DURATION.labels(method, view).observe(duration)
+    DB_QUERIES.labels(method, view).observe(queries)
+    DB_DURATION.labels(method, view).observe(db_duration)
+
+
+def observe_cache(name, hit):
+    CACHE_REQUESTS.labels(name, "hit" if hit else "miss").inc()
+
+
+def observe_write(kind, action, count=1):
+    if count:
+        WRITES.labels(kind, action).inc(count)
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus
+
+    Требуется заголовок «Authorization: Bearer <METRICS_TOKEN>»; без
+    METRICS_TOKEN адрес закрыт (404), так как /api/ открыт наружу.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    if not hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", ""),
+        f"Bearer {settings.METRICS_TOKEN}",
+    ):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if os.environ.get(MULTIPROCESS_DIR):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,237 @@
+import asyncio
+import cProfile
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject, empty
+
+from foodgram_backend.metrics import observe_request
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, -(-percent * len(ordered) // 100))
+    return ordered[rank - 1]
+
+
+class EndpointStats:
+    """Скользящее окно замеров одного представления"""
+
+    METRICS = ("wall_ms", "db_ms", "queries", "duplicates")
+
+    def __init__(self, window):
+        self.count = 0
+        self.samples = {
+            metric: deque(maxlen=window) for metric in self.METRICS}
+
+    def add(self, **values):
+        self.count += 1
+        for metric in self.METRICS:
+            self.samples[metric].append(values[metric])
+
+    def summary(self):
+        result = {"count": self.count}
+        for metric, values in self.samples.items():
+            result[metric] = {
+                f"p{percent}": round(percentile(values, percent), 1)
+                for percent in PERCENTILES
+            }
+        return result
+
+
+class ProfilingStats:
+    """Замеры запросов в памяти процесса по представлениям"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, **values):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(
+                    settings.PROFILING_WINDOW)
+            stats.add(**values)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                endpoint: stats.summary()
+                for endpoint, stats in sorted(self.endpoints.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+
+stats = ProfilingStats()
+
+
+class QueryRecorder:
+    """Обёртка выполнения SQL, считающая время и повторы запросов"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+# Замер текущего запроса. Контекст копируется в потоки sync_to_async,
+# поэтому запросы к БД синхронного кода учитываются и в режиме ASGI.
+current_recorder = ContextVar("query_recorder", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def view_name(request):
+    """Имя маршрута, например «recipes-list»"""
+    match = request.resolver_match
+    return match.view_name if match is not None else "unresolved"
+
+
+def can_see_timing(request):
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # Представление не обращалось к пользователю сессии, и загружать
+        # его ради заголовка не нужно.
+        user = None
+    return (
+        settings.DEBUG
+        or request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+        or (user is not None and user.is_staff)
+    )
+
+
+class ProfilingMiddleware:
+    """Время ответа, время в БД, число запросов и повторов по представлениям
+
+    Замеры копятся в stats и отдаются в заголовке Server-Timing для
+    сотрудников и адресов из INTERNAL_IPS, а при METRICS попадают ещё и в
+    метрики Prometheus. Доля PROFILING_SAMPLE_RATE запросов выполняется
+    под cProfile; профили запросов дольше PROFILING_SLOW_MS сохраняются
+    в PROFILING_DIR.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как в django.utils.deprecation.MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        for connection in connections.all():
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not (settings.PROFILING or settings.METRICS):
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        profiler = None
+        if settings.PROFILING and (
+            random.random() < settings.PROFILING_SAMPLE_RATE
+        ):
+            profiler = cProfile.Profile()
+        token = current_recorder.set(recorder)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, start, profiler)
+
+    async def __acall__(self, request):
+        """Асинхронный вариант; cProfile в нём не используется, так как
+        в потоке цикла событий чередуются разные запросы"""
+        if not (settings.PROFILING or settings.METRICS):
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start, profiler=None):
+        wall_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+        view = view_name(request)
+        if settings.METRICS:
+            observe_request(
+                request.method, view, response.status_code,
+                wall_ms / 1000, recorder.count, recorder.duration,
+            )
+        if not settings.PROFILING:
+            return response
+        endpoint = f"{request.method} {view}"
+        stats.record(
+            endpoint,
+            wall_ms=wall_ms,
+            db_ms=db_ms,
+            queries=recorder.count,
+            duplicates=recorder.duplicates,
+        )
+        if profiler is not None and wall_ms >= settings.PROFILING_SLOW_MS:
+            self.dump_profile(profiler, endpoint, wall_ms)
+        if can_see_timing(request):
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={db_ms:.1f};desc="{recorder.count} queries, '
+                f'{recorder.duplicates} duplicates"',
+                f"app;dur={wall_ms - db_ms:.1f}",
+                f"total;dur={wall_ms:.1f}",
+            ])
+        return response
+
+    def dump_profile(self, profiler, endpoint, wall_ms):
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^\w.-]+", "_", endpoint)
+        profiler.dump_stats(
+            directory / f"{time.time_ns()}-{name}-{wall_ms:.0f}ms.prof")
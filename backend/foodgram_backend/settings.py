@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "foodgram_backend.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -62,17 +63,50 @@ TEMPLATES = [
 WSGI_APPLICATION = "foodgram_backend.wsgi.application"
 
 
+# Переиспользование соединений с БД (foodgram_backend.db):
+# DB_CONN_MAX_AGE — время жизни соединения потока в секундах;
+# DB_CONN_HEALTH_CHECKS — проверка переиспользуемого соединения перед
+# первым запросом в каждом запросе к API; DB_POOL_SIZE — пул соединений
+# процесса для многопоточного режима и ASGI, соединение возвращается
+# в пул в конце каждого запроса, поэтому CONN_MAX_AGE с ним равен 0.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 0))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "foodgram_backend.db",
         "NAME": os.getenv("POSTGRES_DB", "django"),
         "USER": os.getenv("POSTGRES_USER", "django"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
         "HOST": os.getenv("DB_HOST", "db"),
         "PORT": os.getenv("DB_PORT", 5432),
+        "CONN_MAX_AGE": (
+            0 if DB_POOL_SIZE else int(os.getenv("DB_CONN_MAX_AGE", 0))),
+        "CONN_HEALTH_CHECKS": (
+            os.getenv("DB_CONN_HEALTH_CHECKS", "False") == "True"),
+        "POOL_SIZE": DB_POOL_SIZE,
+        "POOL_TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+    }
+}
+
+# LocMemCache живёт в памяти одного процесса: при нескольких воркерах
+# gunicorn изменения справочников (и их ETag) видны остальным воркерам
+# только по истечении CATALOGUE_CACHE_TIMEOUT. Для мгновенной инвалидации укажите
+# общий бэкенд (Redis, Memcached, БД) в CACHE_BACKEND и CACHE_LOCATION.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "foodgram"),
     }
 }
 
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv("CATALOGUE_CACHE_TIMEOUT", 300))
+
+# Срок жизни готовых ответов для анонимных запросов к рецептам. Ограничивает
+# устаревание порядка ?ordering=-popularity и данных авторов.
+RECIPE_CACHE_TIMEOUT = int(os.getenv("RECIPE_CACHE_TIMEOUT", 60))
+
 PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.PBKDF2PasswordHasher",
     "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
@@ -124,7 +158,7 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.TokenAuthentication",
     ],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.PageNumberOrCursorPagination",
     "PAGE_SIZE": 6,
 }
 
@@ -143,3 +177,66 @@ DJOSER = {
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Замеры запросов по представлениям (foodgram_backend.profiling): окно
+# перцентилей на представление, доля запросов под cProfile и порог
+# длительности, после которого профиль сохраняется в PROFILING_DIR.
+# По умолчанию выключено: включается PROFILING=True на время разбора.
+PROFILING = os.getenv("PROFILING", "False") == "True"
+PROFILING_WINDOW = int(os.getenv("PROFILING_WINDOW", 1000))
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_SLOW_MS = int(os.getenv("PROFILING_SLOW_MS", 500))
+PROFILING_DIR = os.getenv("PROFILING_DIR", BASE_DIR / "profiles")
+
+# Метрики Prometheus по адресу /api/metrics (foodgram_backend.metrics);
+# адрес требует заголовок Authorization с METRICS_TOKEN, без токена закрыт.
+METRICS = os.getenv("METRICS", "True") == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Режим сервера: wsgi — синхронные воркеры gunicorn, asgi — воркеры
+# uvicorn и асинхронные представления чтения рецептов и справочников
+# (api.async_views). Режим воркеров выбирается в gunicorn.conf.py.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+ASYNC_VIEWS = SERVER_MODE == "asgi"
+
+# Приведение единиц измерения при суммировании списка покупок:
+# единица -> (базовая единица, множитель).
+UNIT_CONVERSIONS = {
+    "кг": ("г", 1000),
+    "л": ("мл", 1000),
+    "стакан": ("мл", 250),
+    "ст. л.": ("мл", 15),
+    "ч. л.": ("мл", 5),
+    "шт": ("шт.", 1),
+    "штука": ("шт.", 1),
+}
+
+# Максимальное число подсказок при поиске ингредиента по названию.
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 20))
+
+# Максимальное число рецептов в одном пакетном запросе к избранному
+# или корзине.
+BULK_RECIPES_LIMIT = int(os.getenv("BULK_RECIPES_LIMIT", 100))
+
+# Уменьшенные копии изображений рецептов: название -> наибольшая сторона.
+IMAGE_VARIANTS = {
+    "thumbnail": 160,
+    "card": 480,
+    "full": 1280,
+}
+
+IMAGE_VARIANT_FORMATS = ("webp", "jpeg")
+
+# Число фоновых потоков обработки изображений; 0 — обработка сразу
+# после фиксации транзакции в потоке запроса.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+# Ограничения изображения рецепта: размер файла и число пикселей.
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv("RECIPE_IMAGE_MAX_SIZE", 10 * 2 ** 20))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv("RECIPE_IMAGE_MAX_PIXELS", 40 * 10 ** 6))
+
+# Файлы multipart больше этого размера пишутся во временный файл на диске.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 2 ** 10
+
+# Тело JSON должно вмещать изображение в base64 (+ треть к размеру).
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 2 ** 20
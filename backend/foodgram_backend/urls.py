@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from foodgram_backend.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/metrics", metrics_view, name="metrics"),
     path("api/", include("api.urls")),
 ]
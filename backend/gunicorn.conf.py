@@ -0,0 +1,28 @@
+import os
+import shutil
+
+bind = "0.0.0.0:9000"
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+
+# SERVER_MODE=asgi: воркеры uvicorn и асинхронные представления чтения
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "foodgram_backend.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "foodgram_backend.wsgi:application"
+
+
+def on_starting(server):
+    """Очистка файлов метрик Prometheus от прошлого запуска"""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    """Метрики завершившегося воркера больше не учитываются в gauge"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -6,6 +6,7 @@ from .models import (
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
     TagInRecipe,
 )
@@ -20,6 +21,13 @@ class RecipeAdmin(admin.ModelAdmin):
         "image",
         "text",
         "cooking_time",
+        "favorites_count",
+        "in_carts_count",
+        "pub_date",
+    )
+    readonly_fields = (
+        "favorites_count",
+        "in_carts_count",
     )
     list_filter = (
         "author",
@@ -33,6 +41,10 @@ class RecipeAdmin(admin.ModelAdmin):
         "cooking_time",
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk=obj.pk).update_search_documents()
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -71,20 +83,100 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
     )
     list_filter = ("ingredient",)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.refresh_recipe(obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.refresh_recipe(obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list("recipe", flat=True))
+        super().delete_queryset(request, queryset)
+        for recipe_id in recipe_ids:
+            self.refresh_recipe(recipe_id)
+
+    @staticmethod
+    def refresh_recipe(recipe_id):
+        """Поисковый документ, число ингредиентов и списки покупок
+        изменённого рецепта"""
+        recipe = Recipe.objects.filter(pk=recipe_id)
+        recipe.update_search_documents()
+        recipe.reconcile_counters()
+        ShoppingListItem.objects.rebuild(
+            ShoppingCart.objects.filter(recipe_id=recipe_id).values("user"))
+
+
+class RecipeMembershipAdmin(admin.ModelAdmin):
+    """Избранное и корзины: правки в админке пересчитывают счётчики
+    затронутых рецептов, как запросы к API"""
 
-@admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
     list_display = (
         "recipe",
         "user",
     )
     list_filter = ("recipe",)
 
+    def save_model(self, request, obj, form, change):
+        recipes = {obj.recipe_id}
+        if change:
+            recipes.update(self.model.objects.filter(
+                pk=obj.pk).values_list("recipe", flat=True))
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk__in=recipes).reconcile_counters()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).reconcile_counters()
+
+    def delete_queryset(self, request, queryset):
+        recipes = set(queryset.values_list("recipe", flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipes).reconcile_counters()
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(RecipeMembershipAdmin):
+    pass
+
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RecipeMembershipAdmin):
+    def save_model(self, request, obj, form, change):
+        users = {obj.user_id}
+        if change:
+            users.update(ShoppingCart.objects.filter(
+                pk=obj.pk).values_list("user", flat=True))
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild(users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild([obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list("user", flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(users)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
     list_display = (
-        "recipe",
         "user",
+        "ingredient",
+        "amount",
+        "recipes_count",
     )
-    list_filter = ("recipe",)
+    list_filter = ("user",)
+    readonly_fields = (
+        "user",
+        "ingredient",
+        "amount",
+        "recipes_count",
+    )
+
+    def has_add_permission(self, request):
+        # Позиции ведутся по корзинам, см. команду rebuild_shopping_lists
+        return False
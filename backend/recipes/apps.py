@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
+
+    def ready(self):
+        from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                                    Tag, TagInRecipe)
+        from recipes.signals import (build_image_variants,
+                                     create_ingredient_search_index,
+                                     create_recipe_search_index,
+                                     delete_image_variants,
+                                     invalidate_catalogue,
+                                     invalidate_recipe_cache,
+                                     remove_from_shopping_lists,
+                                     update_ingredient_search_documents)
+
+        post_migrate.connect(create_ingredient_search_index, sender=self)
+        post_migrate.connect(create_recipe_search_index, sender=self)
+        post_save.connect(update_ingredient_search_documents,
+                          sender=Ingredient)
+        for model in (Ingredient, Tag):
+            post_save.connect(invalidate_catalogue, sender=model)
+            post_delete.connect(invalidate_catalogue, sender=model)
+        post_save.connect(build_image_variants, sender=Recipe)
+        pre_delete.connect(remove_from_shopping_lists, sender=Recipe)
+        post_delete.connect(delete_image_variants, sender=Recipe)
+        for model in (Recipe, IngredientInRecipe, TagInRecipe):
+            post_save.connect(invalidate_recipe_cache, sender=model)
+            post_delete.connect(invalidate_recipe_cache, sender=model)
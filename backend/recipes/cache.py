@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+RECIPES_VERSION = "recipes"
+# Версии справочников (model_name тэгов и ингредиентов)
+CATALOGUE_VERSIONS = ("tag", "ingredient")
+
+
+def _version_key(name):
+    return f"version:{name}"
+
+
+def _version_timeout(name):
+    """Версия справочника живёт столько же, сколько сам справочник
+
+    С LocMemCache воркер, не обработавший изменение, иначе никогда не
+    сменил бы версию, а с ней ETag и ключ справочника.
+    """
+    if name in CATALOGUE_VERSIONS:
+        return settings.CATALOGUE_CACHE_TIMEOUT
+    return None
+
+
+def get_version(name):
+    """Текущая версия закэшированных данных
+
+    Если ключ версии вытеснен из кэша, берётся новое значение на основе
+    времени, чтобы не вернуть устаревшие данные под старой версией.
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=_version_timeout(name)):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    """Инвалидация всех записей кэша, построенных на версии name"""
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        return get_version(name)
+
+
+def get_versions(names):
+    """Версии из кэша одним обращением; вытесненные версии не попадают
+    в результат"""
+    keys = {_version_key(name): name for name in names}
+    return {
+        keys[key]: version for key, version in cache.get_many(keys).items()
+    }
+
+
+def recipe_version_name(recipe_id):
+    return f"recipe:{recipe_id}"
+
+
+def invalidate_recipe(recipe_id, membership=True):
+    """Сброс закэшированных представлений рецепта после фиксации транзакции
+
+    membership — изменился ли состав или порядок списков рецептов
+    (создание, удаление, смена названия или тэгов).
+    """
+
+    def bump():
+        bump_version(recipe_version_name(recipe_id))
+        if membership:
+            bump_version(RECIPES_VERSION)
+
+    transaction.on_commit(bump)
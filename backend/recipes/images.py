@@ -0,0 +1,121 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "recipes/variants"
+SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True,
+             "progressive": True},
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def build_variants(name):
+    """Уменьшенные копии изображения во всех размерах и форматах
+
+    Исходный файл декодируется один раз, размеры строятся от большего
+    к меньшему, каждый следующий — из предыдущего.
+    """
+    sizes = sorted(
+        settings.IMAGE_VARIANTS.items(), key=lambda item: item[1],
+        reverse=True,
+    )
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.draft("RGB", (sizes[0][1], sizes[0][1]))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    stem = PurePosixPath(name).stem
+    variants = {"source": name}
+    for variant, size in sizes:
+        image.thumbnail((size, size), Image.LANCZOS)
+        for extension in settings.IMAGE_VARIANT_FORMATS:
+            buffer = io.BytesIO()
+            image.save(buffer, **SAVE_OPTIONS[extension])
+            variants.setdefault(variant, {})[extension] = default_storage.save(
+                f"{VARIANTS_DIR}/{stem}_{variant}.{extension}",
+                ContentFile(buffer.getvalue()),
+            )
+    return variants
+
+
+def delete_variants(variants, keep=None):
+    """Удаление файлов копий variants, кроме тех, что есть в keep"""
+    kept = set(variant_paths(keep or {}))
+    for path in variant_paths(variants):
+        if path not in kept:
+            default_storage.delete(path)
+
+
+def variant_paths(variants):
+    for variant, formats in variants.items():
+        if variant != "source":
+            yield from formats.values()
+
+
+def process_recipe_image(recipe_id, name):
+    """Построение копий изображения рецепта и сохранение путей к ним
+
+    Копии прежнего изображения удаляются из хранилища. Если изображение
+    успело смениться или рецепт удалён, удаляются только что построенные.
+    """
+    from recipes.cache import invalidate_recipe
+    from recipes.models import Recipe
+
+    try:
+        variants = build_variants(name)
+        with transaction.atomic():
+            recipe = Recipe.objects.select_for_update().filter(
+                pk=recipe_id, image=name).only("image_variants").first()
+            if recipe is None:
+                stale, variants = variants, None
+            else:
+                stale = recipe.image_variants
+                Recipe.objects.filter(pk=recipe_id).update(
+                    image_variants=variants)
+        if variants is not None:
+            invalidate_recipe(recipe_id, membership=False)
+        delete_variants(stale, keep=variants)
+    except Exception:
+        logger.exception("Не удалось обработать изображение %s", name)
+
+
+def _process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        # У каждого потока своё соединение с БД, его нужно закрыть.
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Обработка изображения в фоновом потоке после фиксации транзакции"""
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.IMAGE_WORKERS:
+            get_executor().submit(_process_in_worker, recipe_id, name)
+        else:
+            process_recipe_image(recipe_id, name)
+
+    transaction.on_commit(submit)
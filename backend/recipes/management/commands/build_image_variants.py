@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Построение уменьшенных копий изображений для рецептов, у которых "
+        "их ещё нет или они устарели."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Перестроить копии для всех рецептов",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = Recipe.objects.exclude(image="").only(
+            "pk", "image", "image_variants")
+        for recipe in recipes.iterator():
+            source = recipe.image_variants.get("source")
+            if options["all"] or source != recipe.image.name:
+                process_recipe_image(recipe.pk, recipe.image.name)
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано изображений: {processed}"))
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.cache import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / "data" / "ingredients.csv"
+
+
+def read_rows(path):
+    """Построчное чтение каталога ингредиентов из CSV или JSON"""
+    if path.suffix == ".json":
+        with path.open(encoding="utf-8") as file:
+            for item in json.load(file):
+                yield item["name"], item["measurement_unit"]
+        return
+    with path.open(encoding="utf-8", newline="") as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Загрузка каталога ингредиентов из CSV или JSON. Повторный запуск "
+        "пропускает уже существующие записи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=str(DEFAULT_PATH))
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--copy", action="store_true",
+            help="Загрузка через COPY (только PostgreSQL)",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy поддерживается только в PostgreSQL")
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options["copy"]:
+                read, created = self.load_copy(path)
+            else:
+                read, created = self.load_bulk(path, options["batch_size"])
+        # bulk_create и COPY не отправляют post_save.
+        bump_version(Ingredient._meta.model_name)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Прочитано {read}, добавлено {created} ингредиентов "
+            f"за {elapsed:.2f} с ({read / max(elapsed, 1e-6):.0f} строк/с)"
+        ))
+
+    def load_bulk(self, path, batch_size):
+        before = Ingredient.objects.count()
+        read = 0
+        for batch in batches(read_rows(path), batch_size):
+            read += len(batch)
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch
+                ],
+                ignore_conflicts=True,
+            )
+        return read, Ingredient.objects.count() - before
+
+    def load_copy(self, path):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        read = 0
+        for row in read_rows(path):
+            writer.writerow(row)
+            read += 1
+        buffer.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE ingredient_import "
+                "(name varchar(200), measurement_unit varchar(200)) "
+                "ON COMMIT DROP"
+            )
+            cursor.copy_expert(
+                "COPY ingredient_import FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT name, measurement_unit "
+                "FROM ingredient_import ON CONFLICT DO NOTHING"
+            )
+            return read, cursor.rowcount
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка списков покупок с корзинами и пересборка разошедшихся. "
+        "Запускается периодически, чтобы исправить расхождения после "
+        "правок в обход API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, nargs="*",
+            help="Проверить только списки этих пользователей (id)",
+        )
+
+    def handle(self, *args, **options):
+        drifted = ShoppingListItem.objects.rebuild(options["users"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересобраны списки покупок у {drifted} пользователей"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт счётчиков избранного, корзин и ингредиентов у рецептов. "
+        "Запускается "
+        "периодически, чтобы исправить расхождения после удаления "
+        "пользователей или правок в админке."
+    )
+
+    def handle(self, *args, **options):
+        drifted = Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Исправлены счётчики у {drifted} рецептов"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересборка поисковых документов рецептов. Запускается после "
+        "добавления поиска и после массовых правок рецептов или "
+        "ингредиентов в обход API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        ids = list(
+            Recipe.objects.order_by("id").values_list("id", flat=True))
+        size = options["batch_size"]
+        for start in range(0, len(ids), size):
+            Recipe.objects.filter(
+                pk__in=ids[start:start + size]).update_search_documents()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлены поисковые документы {len(ids)} рецептов"))
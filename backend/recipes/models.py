@@ -1,7 +1,12 @@
 from colorfield.fields import ColorField
-from django.db import models
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections, models
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import Coalesce, RowNumber, StrIndex
+from django.utils import timezone
 
-from users.models import User
+from users.models import Subscribes, User
 
 
 class Ingredient(models.Model):
@@ -55,6 +60,203 @@ class Tag(models.Model):
         return self.name
 
 
+# Конфигурация полнотекстового поиска PostgreSQL (стемминг русского языка)
+SEARCH_CONFIG = "russian"
+
+
+def search_vector():
+    """tsvector рецепта: название с весом A, поисковый документ с весом B
+
+    Выражение совпадает с выражением GIN-индекса из recipes.signals,
+    иначе PostgreSQL не сможет использовать индекс.
+    """
+    return SearchVector(
+        "name", config=SEARCH_CONFIG, weight="A"
+    ) + SearchVector("search_document", config=SEARCH_CONFIG, weight="B")
+
+
+def build_search_document(name, text, ingredient_names):
+    """Текст для поиска: название, ингредиенты и описание в нижнем
+    регистре (LIKE в SQLite не учитывает регистр только для латиницы)"""
+    return "\n".join([name, " ".join(ingredient_names), text]).lower()
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Подгрузка автора, тэгов и ингредиентов фиксированным числом
+        запросов"""
+        return self.select_related("author").prefetch_related(
+            "tags",
+            models.Prefetch(
+                "recipe",
+                queryset=IngredientInRecipe.objects.select_related(
+                    "ingredient"
+                ).order_by("ingredient__name"),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотация признаков избранного, корзины и подписки на автора"""
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef("pk"))
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef("pk"))
+            ),
+            author_is_subscribed=models.Exists(
+                Subscribes.objects.filter(
+                    user=user, author=models.OuterRef("author"))
+            ),
+        )
+
+    def reconcile_counters(self):
+        """Пересчёт счётчиков избранного, корзин и ингредиентов по
+        фактическим записям
+
+        Возвращает число рецептов, у которых счётчики разошлись.
+        """
+        actual = {
+            "favorites_count": Coalesce(
+                models.Subquery(
+                    Favorite.objects.filter(recipe=models.OuterRef("pk"))
+                    .order_by().values("recipe")
+                    .annotate(total=models.Count("id")).values("total")
+                ),
+                0,
+            ),
+            "in_carts_count": Coalesce(
+                models.Subquery(
+                    ShoppingCart.objects.filter(recipe=models.OuterRef("pk"))
+                    .order_by().values("recipe")
+                    .annotate(total=models.Count("id")).values("total")
+                ),
+                0,
+            ),
+            "ingredients_count": Coalesce(
+                models.Subquery(
+                    IngredientInRecipe.objects.filter(
+                        recipe=models.OuterRef("pk"))
+                    .order_by().values("recipe")
+                    .annotate(total=models.Count("id")).values("total")
+                ),
+                0,
+            ),
+        }
+        drifted = self.annotate(
+            actual_favorites=actual["favorites_count"],
+            actual_carts=actual["in_carts_count"],
+            actual_ingredients=actual["ingredients_count"],
+        ).exclude(
+            favorites_count=models.F("actual_favorites"),
+            in_carts_count=models.F("actual_carts"),
+            ingredients_count=models.F("actual_ingredients"),
+        ).count()
+        if drifted:
+            self.update(**actual)
+        return drifted
+
+    def search(self, query):
+        """Рецепты по поисковому запросу, самые релевантные первыми
+
+        В PostgreSQL — полнотекстовый поиск по GIN-индексу со стеммингом
+        и ранжированием ts_rank. В остальных СУБД — каждое слово запроса
+        ищется подстрокой в поисковом документе, выше рецепты, где первое
+        слово встречается раньше (в названии, затем в ингредиентах).
+        """
+        if connections[self.db].vendor == "postgresql":
+            vector = search_vector()
+            query = SearchQuery(
+                query, config=SEARCH_CONFIG, search_type="websearch")
+            return self.annotate(
+                search=vector, search_rank=SearchRank(vector, query)
+            ).filter(search=query).order_by("-search_rank", "-pub_date", "-id")
+        words = query.lower().split()
+        if not words:
+            return self
+        queryset = self
+        for word in words:
+            queryset = queryset.filter(search_document__contains=word)
+        return queryset.annotate(
+            search_rank=StrIndex("search_document", models.Value(words[0]))
+        ).order_by("search_rank", "-pub_date", "-id")
+
+    def cookable(self, ingredient_ids, max_missing=0):
+        """Рецепты, которым из ingredient_ids не хватает не больше
+        max_missing ингредиентов; сначала те, где не хватает меньше
+
+        Кандидаты отбираются группировкой строк узкого индекса
+        (ingredient, recipe) с условием HAVING по разности с
+        ingredients_count, поэтому широкие строки рецептов читаются только
+        для подошедших. Рецепты без единого совпадения не возвращаются.
+        """
+        owned = IngredientInRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids)
+        candidates = owned.values("recipe").annotate(
+            missing=models.F("recipe__ingredients_count")
+            - models.Count("id"),
+        ).filter(missing__lte=max_missing).values("recipe")
+        matched = owned.filter(
+            recipe=models.OuterRef("pk")
+        ).order_by().values("recipe").annotate(
+            total=models.Count("id")).values("total")
+        return self.filter(pk__in=candidates).annotate(
+            matched_count=models.Subquery(matched),
+        ).annotate(
+            missing_count=models.F("ingredients_count")
+            - models.F("matched_count"),
+        ).order_by("missing_count", "-matched_count", "-pub_date", "-id")
+
+    def update_search_documents(self):
+        """Пересборка поисковых документов рецептов
+
+        Возвращает число обновлённых рецептов.
+        """
+        recipes = list(
+            self.only("id", "name", "text").prefetch_related(
+                models.Prefetch(
+                    "ingredients",
+                    queryset=Ingredient.objects.only("name"),
+                )
+            )
+        )
+        for recipe in recipes:
+            recipe.search_document = build_search_document(
+                recipe.name,
+                recipe.text,
+                [ingredient.name for ingredient in recipe.ingredients.all()],
+            )
+        self.model.objects.bulk_update(
+            recipes, ["search_document"], batch_size=500)
+        return len(recipes)
+
+    def top_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора одним запросом
+
+        Номер рецепта внутри автора считается оконной функцией ROW_NUMBER,
+        отбор по нему выполняется во вложенном запросе.
+        """
+        ranked = self.order_by().annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=[models.F("author_id")],
+                order_by=models.F("id").desc(),
+            )
+        ).values("id", "position")
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.filter(
+            pk__in=RawSQL(
+                f"SELECT ranked.id FROM ({sql}) ranked "
+                "WHERE ranked.position <= %s",
+                (*params, limit),
+            )
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -70,6 +272,12 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name="Изображение рецепта",
     )
+    image_variants = models.JSONField(
+        verbose_name="Уменьшенные копии изображения",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name="Описание рецепта",
         null=False,
@@ -87,11 +295,47 @@ class Recipe(models.Model):
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name="Время приготовления",
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        db_index=True,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В корзинах",
+        default=0,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name="Дата публикации",
+        default=timezone.now,
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        verbose_name="Число ингредиентов",
+        default=0,
+        editable=False,
+    )
+    search_document = models.TextField(
+        verbose_name="Поисковый документ",
+        default="",
+        blank=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ("name",)
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(
+                fields=("-pub_date", "-id"),
+                name="recipe_pub_date_idx",
+            ),
+            models.Index(
+                fields=("author", "-pub_date"),
+                name="recipe_author_pub_date_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -103,11 +347,13 @@ class IngredientInRecipe(models.Model):
         related_name="recipe",
         on_delete=models.CASCADE
     )
+    # Поиск по ingredient обслуживает индекс (ingredient, recipe)
     ingredient = models.ForeignKey(
         Ingredient,
         verbose_name="Ингредиент",
         related_name="ingredient_in_recipe",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     amount = models.IntegerField(
         verbose_name="Количество",
@@ -122,9 +368,18 @@ class IngredientInRecipe(models.Model):
                     "recipe",
                     "ingredient",
                 ),
+                # Без INCLUDE: SQLite не создаёт такие ограничения
                 name="unique_recipe_ingredient",
             ),
         ]
+        indexes = [
+            # Подбор рецептов по имеющимся ингредиентам читает только
+            # этот индекс
+            models.Index(
+                fields=("ingredient", "recipe"),
+                name="ingredient_recipe_idx",
+            ),
+        ]
         ordering = ("ingredient",)
 
     def __str__(self) -> str:
@@ -167,8 +422,12 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(
         Recipe, related_name="favorite_recipe", on_delete=models.CASCADE
     )
+    # Поиск по user обслуживает уникальный индекс (user, recipe)
     user = models.ForeignKey(
-        User, related_name="favorite_user", on_delete=models.CASCADE
+        User,
+        related_name="favorite_user",
+        on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
@@ -177,8 +436,8 @@ class Favorite(models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=(
-                    "recipe",
                     "user",
+                    "recipe",
                 ),
                 name="unique_favorite_recipe",
             ),
@@ -190,11 +449,13 @@ class Favorite(models.Model):
 
 
 class ShoppingCart(models.Model):
+    # Поиск по user обслуживает уникальный индекс (user, recipe)
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="shopping_cart",
         verbose_name="Пользователь",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -218,3 +479,167 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Корзину покупок'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        """Ингредиенты рецептов, добавленных в корзину пользователя;
+        sign=-1 вычитает ингредиенты рецептов, убранных из корзины"""
+        return self.apply(
+            IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids),
+            models.Value(user_id),
+            sign,
+        )
+
+    def add_carts(self, recipes, sign=1):
+        """Ингредиенты рецептов recipes во всех корзинах, где они лежат
+
+        При изменении состава рецепта старые ингредиенты вычитаются
+        (sign=-1) до изменения, новые прибавляются после.
+        """
+        return self.apply(
+            IngredientInRecipe.objects.filter(
+                recipe__in=recipes, recipe__shopping_cart__isnull=False),
+            models.F("recipe__shopping_cart__user"),
+            sign,
+        )
+
+    @staticmethod
+    def items(ingredients, user, sign=1):
+        """Строки списка (пользователь, ингредиент, количество, рецептов)
+        из ингредиентов рецептов"""
+        return ingredients.order_by().values(
+            list_user=user,
+            list_ingredient=models.F("ingredient"),
+        ).annotate(
+            list_amount=models.Sum("amount") * sign,
+            list_recipes=models.Count("id") * sign,
+        )
+
+    def apply(self, ingredients, user, sign=1):
+        """Прибавление строк из ingredients к спискам покупок одним
+        INSERT … ON CONFLICT DO UPDATE
+
+        Позиции, у которых не осталось рецептов, удаляются — только среди
+        пользователей и ингредиентов, которые вернул сам INSERT. Строки
+        вставляются по порядку ключа, чтобы одновременные изменения
+        списков не блокировали друг друга.
+        """
+        source = self.items(ingredients, user, sign).order_by(
+            "list_user", "list_ingredient")
+        sql, params = source.query.sql_with_params()
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} "
+                "(user_id, ingredient_id, amount, recipes_count) "
+                f"{sql} ON CONFLICT (user_id, ingredient_id) DO UPDATE SET "
+                f"amount = {table}.amount + EXCLUDED.amount, "
+                f"recipes_count = {table}.recipes_count "
+                "+ EXCLUDED.recipes_count "
+                "RETURNING user_id, ingredient_id, recipes_count",
+                params,
+            )
+            emptied = [row[:2] for row in cursor.fetchall() if row[2] <= 0]
+        if emptied:
+            users, ingredients = map(set, zip(*emptied))
+            self.filter(
+                user__in=users,
+                ingredient__in=ingredients,
+                recipes_count__lte=0,
+            ).delete()
+
+    def rebuild(self, users=None):
+        """Пересборка списков покупок users (всех, если None) по корзинам
+
+        Возвращает число пользователей, у которых список расходился
+        с корзиной; пересобираются только их списки.
+        """
+        carts = {"recipe__shopping_cart__isnull": False}
+        stored = self.all()
+        if users is not None:
+            carts = {"recipe__shopping_cart__user__in": users}
+            stored = stored.filter(user__in=users)
+        expected = self.items(
+            IngredientInRecipe.objects.filter(**carts),
+            models.F("recipe__shopping_cart__user"),
+        ).values_list(
+            "list_user", "list_ingredient", "list_amount", "list_recipes")
+        # Одинаковые имена столбцов нужны EXCEPT в обе стороны
+        stored = stored.annotate(
+            list_user=models.F("user"),
+            list_ingredient=models.F("ingredient"),
+            list_amount=models.F("amount"),
+            list_recipes=models.F("recipes_count"),
+        ).values_list(
+            "list_user", "list_ingredient", "list_amount", "list_recipes")
+        drifted = {
+            row[0]
+            for rows in (
+                expected.difference(stored), stored.difference(expected))
+            for row in rows
+        }
+        if drifted:
+            self.filter(user__in=drifted).delete()
+            self.apply(
+                IngredientInRecipe.objects.filter(
+                    recipe__shopping_cart__user__in=drifted),
+                models.F("recipe__shopping_cart__user"),
+            )
+        return len(drifted)
+
+
+class ShoppingListItem(models.Model):
+    """Ингредиент списка покупок: сумма по рецептам из корзины
+
+    Обновляется при изменении корзины и состава рецептов в ней, поэтому
+    список покупок читается без объединения с ингредиентами рецептов.
+    """
+
+    # Поиск по user обслуживает уникальный индекс (user, ingredient)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField(verbose_name="Количество")
+    recipes_count = models.IntegerField(
+        verbose_name="Рецептов в корзине", default=0)
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Список покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=(
+                    "user",
+                    "ingredient",
+                ),
+                # Без INCLUDE: SQLite не создаёт такие ограничения, а
+                # ON CONFLICT в ShoppingListQuerySet.apply опирается на него
+                name="unique_shopping_list_item",
+            ),
+        ]
+        indexes = [
+            # Позиции без рецептов удаляются после вычитания по
+            # пользователям, чьи списки оно затронуло
+            models.Index(
+                fields=("user",),
+                condition=models.Q(recipes_count__lte=0),
+                name="shopping_list_empty_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.ingredient}"
@@ -0,0 +1,89 @@
+from django.db import connections, transaction
+
+from recipes.cache import bump_version, invalidate_recipe
+from recipes.images import delete_variants, schedule_variants
+from recipes.models import (SEARCH_CONFIG, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingListItem)
+
+
+def create_ingredient_search_index(sender, using, **kwargs):
+    """Индекс для регистронезависимого поиска ингредиентов по подстроке
+
+    В PostgreSQL — триграммный GIN по UPPER(name), который используют
+    запросы istartswith/icontains. В остальных СУБД — индекс по name
+    без учёта регистра для поиска по префиксу.
+    """
+    connection = connections[using]
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_name_trgm "
+                f"ON {table} USING gin (UPPER(name::text) gin_trgm_ops)"
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_name_nocase "
+                f"ON {table} (name COLLATE NOCASE)"
+            )
+
+
+def create_recipe_search_index(sender, using, **kwargs):
+    """GIN-индекс полнотекстового поиска рецептов в PostgreSQL
+
+    Выражение повторяет recipes.models.search_vector.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    table = Recipe._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_search "
+            f"ON {table} USING gin (("
+            f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+            "COALESCE(name, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+            "COALESCE(search_document, '')), 'B')))"
+        )
+
+
+def update_ingredient_search_documents(sender, instance, created, **kwargs):
+    """Переименованный ингредиент меняет поисковые документы рецептов"""
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_documents()
+
+
+def remove_from_shopping_lists(sender, instance, **kwargs):
+    """Удаляемый рецепт уходит из списков покупок до удаления корзин"""
+    ShoppingListItem.objects.add_carts(
+        Recipe.objects.filter(pk=instance.pk), sign=-1)
+
+
+def invalidate_catalogue(sender, **kwargs):
+    """Сброс кэша справочника тэгов или ингредиентов"""
+    bump_version(sender._meta.model_name)
+
+
+def build_image_variants(sender, instance, **kwargs):
+    """Постановка в очередь обработки нового изображения рецепта"""
+    if instance.image and (
+        instance.image_variants.get("source") != instance.image.name
+    ):
+        schedule_variants(instance)
+
+
+def delete_image_variants(sender, instance, **kwargs):
+    """Удаление файлов копий изображения после удаления рецепта"""
+    variants = instance.image_variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+def invalidate_recipe_cache(sender, instance, **kwargs):
+    """Сброс закэшированного представления рецепта"""
+    if sender is Recipe:
+        invalidate_recipe(instance.pk)
+    else:
+        invalidate_recipe(
+            instance.recipe_id, membership=sender is not IngredientInRecipe)
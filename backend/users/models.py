@@ -49,11 +49,13 @@ class Subscribes(models.Model):
         related_name="subscribed",
     )
 
+    # Поиск по user обслуживает уникальный индекс (user, author)
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         verbose_name="Подписанный юзер",
         related_name="subscriber",
+        db_index=False,
     )
 
     class Meta:
@@ -61,7 +63,7 @@ class Subscribes(models.Model):
         verbose_name_plural = "Подписки"
         constraints = [
             models.UniqueConstraint(
-                fields=("author", "user"),
+                fields=("user", "author"),
                 name="unique_subscribes",
             ),
         ]